@@ -0,0 +1,130 @@
+import re
+import hashlib
+import logging
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langdetect import detect, LangDetectException
+
+logger = logging.getLogger(__name__)
+
+# Коды langdetect -> языки Punkt
+PUNKT_LANGUAGES = {
+    "ru": "russian", "en": "english", "de": "german", "fr": "french", "es": "spanish",
+    "it": "italian", "pt": "portuguese", "pl": "polish", "cs": "czech", "nl": "dutch",
+    "tr": "turkish", "uk": "russian",
+}
+DEFAULT_LANGUAGE = "ru"
+
+_SENTENCE_FALLBACK = re.compile(r"\S.*?(?:[.!?](?=\s)|$)", re.DOTALL)
+
+Span = Tuple[int, int]
+
+@lru_cache(maxsize=None)
+def load_sentence_splitter(language: str = "russian"):
+    """Модель Punkt для языка; загружается один раз на процесс"""
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer
+        return PunktTokenizer(language)
+    except ImportError:
+        # Старые версии nltk хранят модели в pickle
+        import nltk
+        return nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+def detect_language(text: str) -> str:
+    try:
+        return detect(text)
+    except LangDetectException:
+        return DEFAULT_LANGUAGE
+
+def sentence_spans(text: str, lang: str = DEFAULT_LANGUAGE) -> List[Span]:
+    """Границы предложений (start, end) в исходном тексте"""
+    try:
+        splitter = load_sentence_splitter(PUNKT_LANGUAGES.get(lang, "russian"))
+        spans = list(splitter.span_tokenize(text))
+    except (LookupError, AttributeError, OSError) as e:
+        print(f"Tokenizer error: {e}")
+        spans = [(m.start(), m.end()) for m in _SENTENCE_FALLBACK.finditer(text)]
+
+    result = []
+    for start, end in spans:
+        # Концы предложений без пробелов
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            result.append((start, end))
+    return result
+
+def split_sentences(text: str, lang: str = DEFAULT_LANGUAGE) -> List[str]:
+    return [text[start:end] for start, end in sentence_spans(text, lang)]
+
+def span_token_counts(text: str, spans: Sequence[Span], tokenizer) -> List[int]:
+    """Число токенов в каждом из подряд идущих фрагментов текста.
+
+    С быстрым токенизатором текст токенизируется один раз, а токены распределяются
+    через offset mapping: токен относится к фрагменту, внутри которого (или перед которым)
+    он начинается. С медленным каждый фрагмент считается отдельно.
+    """
+    if not spans:
+        return []
+    try:
+        offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    except NotImplementedError:
+        lengths = tokenizer([text[s:e] for s, e in spans], add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in lengths]
+
+    counts = [0] * len(spans)
+    starts = [s for s, _ in spans]
+    for start, end in offsets:
+        if end > start:
+            counts[max(0, bisect_right(starts, start) - 1)] += 1
+    return counts
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def analysis_for(text: str, analysis: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Разбор подходит, только если он сделан именно для этого текста"""
+    if analysis is not None and analysis.get("hash") == text_hash(text):
+        return analysis
+    return None
+
+class TextAnalyzer:
+    """Разбор текста при получении: предложения, язык, токены по предложениям и хэш.
+
+    Результат — компактный словарь, который хранится в сессии пользователя и
+    используется упрощением, фактчекингом и переводом вместо повторной сегментации.
+    """
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+        # Быстрый токенизатор нельзя вызывать из нескольких потоков одновременно
+        self._lock = threading.Lock()
+        try:
+            load_sentence_splitter(PUNKT_LANGUAGES[DEFAULT_LANGUAGE])
+        except (LookupError, OSError) as e:
+            logger.warning(f"Модель Punkt не найдена, предложения будут делиться по знакам препинания: {e}")
+
+    @classmethod
+    def from_pretrained(cls, model_path: str) -> "TextAnalyzer":
+        """Отдельный токенизатор модели упрощения: основной занят потоком инференса"""
+        from transformers import AutoTokenizer
+        return cls(AutoTokenizer.from_pretrained(model_path))
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        language = detect_language(text)
+        spans = sentence_spans(text, language)
+        tokens: Optional[List[int]] = None
+        if self.tokenizer is not None:
+            with self._lock:
+                tokens = span_token_counts(text, spans, self.tokenizer)
+        return {
+            "hash": text_hash(text),
+            "language": language,
+            "spans": tuple(spans),
+            "tokens": tuple(tokens) if tokens is not None else None,
+        }
@@ -0,0 +1,250 @@
+import os
+import sys
+import logging
+import argparse
+import importlib
+from shutil import rmtree
+from typing import Any, Dict, List, Optional
+
+import torch
+from transformers import AutoConfig
+
+logger = logging.getLogger(__name__)
+
+# Движки генерации для seq2seq-моделей (упрощение и перевод)
+BACKEND_TORCH = "torch"
+BACKEND_ONNXRUNTIME = "onnxruntime"
+BACKEND_CTRANSLATE2 = "ctranslate2"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNXRUNTIME, BACKEND_CTRANSLATE2)
+
+# Настройки бэкенда: общий и отдельно для каждой модели
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", BACKEND_TORCH)
+SIMPLIFY_BACKEND = os.getenv("SIMPLIFY_BACKEND", INFERENCE_BACKEND)
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", INFERENCE_BACKEND)
+CT2_COMPUTE_TYPE = os.getenv("CT2_COMPUTE_TYPE", "default")  # default | int8 | int8_float32 | float16 ...
+CT2_THREADS = int(os.getenv("CT2_THREADS", "0"))  # 0 — по числу ядер
+# С beam search колбэк ctranslate2 недоступен: партия делится на такие части, отмена проверяется между ними
+CT2_BEAM_SUB_BATCH = int(os.getenv("CT2_BEAM_SUB_BATCH", "2"))
+
+# Файл с ревизией исходной модели внутри сконвертированной папки
+REVISION_FILE = "source_revision.txt"
+
+# Пакеты, которые нужно установить для каждого бэкенда
+BACKEND_PACKAGES = {
+    BACKEND_ONNXRUNTIME: "optimum[onnxruntime]",
+    BACKEND_CTRANSLATE2: "ctranslate2",
+}
+
+def _require(module: str, backend: str):
+    """Импортирует опциональную зависимость бэкенда"""
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise RuntimeError(
+            f"❌ Для бэкенда {backend} установите пакет: pip install {BACKEND_PACKAGES[backend]} ({e})"
+        )
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"❌ Неизвестный бэкенд инференса: {backend} (доступны: {', '.join(BACKENDS)})")
+
+def converted_model_dir(cache_dir: str, backend: str, name: str) -> str:
+    return os.path.join(cache_dir, backend, name)
+
+def convert_model(model_path: str, backend: str, output_dir: str, revision: str) -> str:
+    """Один раз конвертирует модель transformers для бэкенда и кладёт результат в output_dir.
+
+    Повторная конвертация выполняется только при смене ревизии исходной модели.
+    """
+    stamp = os.path.join(output_dir, REVISION_FILE)
+    if os.path.exists(stamp):
+        with open(stamp, encoding="utf-8") as f:
+            if f.read().strip() == revision:
+                return output_dir
+
+    print(f"🔧 Конвертируем {model_path} для {backend} (выполняется один раз)...")
+    tmp_dir = output_dir + ".tmp"
+    rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(output_dir) or ".", exist_ok=True)
+
+    if backend == BACKEND_CTRANSLATE2:
+        converters = _require("ctranslate2.converters", backend)
+        converters.TransformersConverter(model_path).convert(tmp_dir, force=True)
+    elif backend == BACKEND_ONNXRUNTIME:
+        ort = _require("optimum.onnxruntime", backend)
+        model = ort.ORTModelForSeq2SeqLM.from_pretrained(model_path, export=True)
+        model.save_pretrained(tmp_dir)
+    else:
+        raise ValueError(f"❌ Бэкенд {backend} не требует конвертации")
+
+    with open(os.path.join(tmp_dir, REVISION_FILE), "w", encoding="utf-8") as f:
+        f.write(revision)
+    rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    print(f"✅ Сконвертированная модель сохранена: {output_dir}")
+    return output_dir
+
+def ct2_options(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Переводит параметры generate из transformers в параметры ctranslate2 (приблизительно)"""
+    options = {
+        "beam_size": params.get("num_beams", 1),
+        "max_decoding_length": params.get("max_length", 256),
+        "min_decoding_length": params.get("min_length", 0),
+        "length_penalty": params.get("length_penalty", 1.0),
+        "repetition_penalty": params.get("repetition_penalty", 1.0),
+        "no_repeat_ngram_size": params.get("no_repeat_ngram_size", 0),
+    }
+    if params.get("do_sample"):
+        options["sampling_topk"] = 0  # всё распределение, отсечение через top_p
+        options["sampling_topp"] = params.get("top_p", 1.0)
+        options["sampling_temperature"] = params.get("temperature", 1.0)
+    return options
+
+def _step_callback(streamer, stopping_criteria):
+    """Колбэк ctranslate2 для жадного декодирования: потоковый вывод и остановка"""
+    def callback(step):
+        if streamer is not None:
+            streamer.put(torch.tensor([step.token_id]))
+        return _should_stop(stopping_criteria)
+    return callback
+
+def _should_stop(stopping_criteria) -> bool:
+    # Критерии остановки вызываются без тензоров: поддерживаются только
+    # не зависящие от текста (например, отмена запроса)
+    return any(bool(criteria(None, None)) for criteria in stopping_criteria or [])
+
+class CTranslate2Seq2Seq:
+    """ctranslate2.Translator с методом generate() как у моделей transformers.
+
+    Принимает input_ids/attention_mask и возвращает тензор id токенов, поэтому
+    simplify_batch и translate_batch работают с ним без изменений. Потоковый
+    вывод поддерживается только без beam search; с beam search stopping_criteria
+    проверяются между частями партии по CT2_BEAM_SUB_BATCH примеров, а после
+    остановки оставшиеся примеры возвращаются пустыми.
+    """
+
+    def __init__(self, translator, tokenizer, config, beam_sub_batch: int = CT2_BEAM_SUB_BATCH):
+        self.translator = translator
+        self.tokenizer = tokenizer
+        self.config = config
+        self.beam_sub_batch = max(1, beam_sub_batch)
+
+    def generate(self, input_ids=None, attention_mask=None, streamer=None, stopping_criteria=None, **params):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        source = [
+            self.tokenizer.convert_ids_to_tokens([i for i, m in zip(ids, mask) if m])
+            for ids, mask in zip(input_ids.tolist(), attention_mask.tolist())
+        ]
+        options = ct2_options(params)
+        start_id = self.config.decoder_start_token_id
+        pad_id = self.config.pad_token_id
+
+        greedy = options["beam_size"] == 1
+        callback = None
+        if greedy and (streamer is not None or stopping_criteria):
+            callback = _step_callback(streamer, stopping_criteria)
+        step = len(source) if greedy or not stopping_criteria else self.beam_sub_batch
+
+        if streamer is not None:
+            streamer.put(torch.tensor([[start_id]]))
+        hypotheses = []
+        for i in range(0, len(source), step):
+            if not greedy and _should_stop(stopping_criteria):
+                break
+            results = self.translator.translate_batch(source[i:i + step], callback=callback, **options)
+            hypotheses.extend(result.hypotheses[0] for result in results)
+        if streamer is not None:
+            streamer.end()
+
+        # Остановленные до начала примеры — пустые, вызывающий код проверяет отмену сам
+        hypotheses += [[]] * (len(source) - len(hypotheses))
+        sequences = [[start_id] + self.tokenizer.convert_tokens_to_ids(tokens) for tokens in hypotheses]
+        width = max(len(seq) for seq in sequences)
+        return torch.tensor([seq + [pad_id] * (width - len(seq)) for seq in sequences])
+
+def load_backend_model(name: str, model_path: str, tokenizer, backend: str, device: str,
+                       cache_dir: str, revision: str):
+    """Загружает модель name через onnxruntime или ctranslate2, при необходимости конвертируя её"""
+    check_backend(backend)
+    output_dir = convert_model(model_path, backend, converted_model_dir(cache_dir, backend, name), revision)
+
+    if backend == BACKEND_CTRANSLATE2:
+        ctranslate2 = _require("ctranslate2", backend)
+        translator = ctranslate2.Translator(
+            output_dir,
+            device=device,
+            compute_type=CT2_COMPUTE_TYPE,
+            intra_threads=CT2_THREADS
+        )
+        config = AutoConfig.from_pretrained(model_path)
+        return CTranslate2Seq2Seq(translator, tokenizer, config)
+
+    ort = _require("optimum.onnxruntime", backend)
+    provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+    return ort.ORTModelForSeq2SeqLM.from_pretrained(output_dir, provider=provider)
+
+# Тексты для сравнения бэкендов
+PARITY_TEXTS = [
+    "Изменение климата представляет собой долгосрочное изменение средних погодных условий на Земле.",
+    "Центральный банк повысил ключевую ставку, чтобы сдержать рост потребительских цен.",
+    "Фотосинтез — это процесс, при котором растения преобразуют энергию света в химическую энергию.",
+    "Суд признал договор недействительным, поскольку одна из сторон была введена в заблуждение.",
+]
+
+def check_parity(fn, tokenizer, reference, candidate, texts: List[str], device: str, **kwargs) -> float:
+    """Сравнивает результаты fn (simplify_batch / translate_batch) для двух моделей; доля совпадений"""
+    expected = fn(texts, tokenizer, reference, device, **kwargs)
+    actual = fn(texts, tokenizer, candidate, device, **kwargs)
+    matches = 0
+    for text, exp, act in zip(texts, expected, actual):
+        same = exp.strip() == act.strip()
+        matches += same
+        print(f"{'✅' if same else '⚠️'} {text}\n   torch: {exp}\n   другой: {act}")
+    return matches / len(texts) if texts else 1.0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Конвертация моделей заранее и проверка совпадения результатов с torch"""
+    parser = argparse.ArgumentParser(description="Конвертация моделей и проверка бэкендов инференса")
+    parser.add_argument("command", choices=("convert", "parity"))
+    parser.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    parser.add_argument("--min-match", type=float, default=0.75,
+                        help="минимальная доля совпадающих результатов для parity")
+    args = parser.parse_args(argv)
+
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    from download_model import (
+        SIMPLIFY_MODEL_PATH, TRANSLATE_MODEL_NAME, CONVERTED_MODEL_DIR, device, get_model_revision
+    )
+    from utils import simplify_batch, translate_batch
+    from profiles import PROFILE_FAST
+
+    models = {"simplify": SIMPLIFY_MODEL_PATH, "translator": TRANSLATE_MODEL_NAME}
+    ok = True
+    for name, model_path in models.items():
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        reference = AutoModelForSeq2SeqLM.from_pretrained(model_path).to(device)
+        revision = get_model_revision(model_path, reference.config)
+        if args.command == "convert":
+            convert_model(model_path, args.backend, converted_model_dir(CONVERTED_MODEL_DIR, args.backend, name), revision)
+            continue
+
+        candidate = load_backend_model(name, model_path, tokenizer, args.backend, device, CONVERTED_MODEL_DIR, revision)
+        print(f"\n🔍 Сравнение {name}: torch и {args.backend} (жадное декодирование)")
+        if name == "simplify":
+            match = check_parity(
+                lambda texts, tok, model, dev, **kw: simplify_batch(texts, "medium", tok, model, dev, **kw),
+                tokenizer, reference, candidate, PARITY_TEXTS, device, profile=PROFILE_FAST
+            )
+        else:
+            match = check_parity(
+                lambda texts, tok, model, dev, **kw: translate_batch(texts, tok, model, dev, **kw),
+                tokenizer, reference, candidate, PARITY_TEXTS, device, profile=PROFILE_FAST
+            )
+        print(f"📊 Совпадений: {match * 100:.0f}%")
+        ok = ok and match >= args.min_match
+
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from utils import simplify_batch
+from inference import InferenceExecutor, SIMPLIFY_MODELS
+from scheduler import JOB_CLAIM
+from profiles import PROFILE_QUALITY
+from cancellation import CancellationToken, SharedCancellationToken, GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+# Настройки микро-батчинга модели упрощения
+SIMPLIFY_BATCH_SIZE = int(os.getenv("SIMPLIFY_BATCH_SIZE", "8"))
+SIMPLIFY_BATCH_WAIT_MS = float(os.getenv("SIMPLIFY_BATCH_WAIT_MS", "15"))
+
+# Запрос в партии: текст, future для результата и токен отмены
+Entry = Tuple[str, asyncio.Future, Optional[CancellationToken]]
+
+class MicroBatcher:
+    """Собирает запросы на упрощение от разных пользователей в общие партии.
+
+    Запросы копятся несколько миллисекунд, группируются по уровню упрощения
+    и профилю генерации и выполняются одним вызовом simplify_batch через исполнитель инференса.
+    """
+
+    def __init__(self, executor: InferenceExecutor, max_batch_size: int = SIMPLIFY_BATCH_SIZE,
+                 max_wait_ms: float = SIMPLIFY_BATCH_WAIT_MS):
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._pending: Dict[Hashable, List[Entry]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+
+    async def simplify(self, text: str, strength: str = "medium", profile: str = PROFILE_QUALITY,
+                       cancel_token: Optional[CancellationToken] = None) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (strength, profile)
+        entry = (text, future, cancel_token)
+        batch = self._pending.setdefault(key, [])
+        batch.append(entry)
+
+        if len(batch) >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+
+        if cancel_token is not None:
+            cancel_token.add_callback(lambda: loop.call_soon_threadsafe(self._drop, key, entry))
+
+        return await future
+
+    def _drop(self, key: Hashable, entry: Entry):
+        """Отменённый запрос сразу освобождает место в партии"""
+        batch = self._pending.get(key)
+        if batch and entry in batch:
+            batch.remove(entry)
+            if not batch:
+                self._pending.pop(key)
+                timer = self._timers.pop(key, None)
+                if timer is not None:
+                    timer.cancel()
+        future = entry[1]
+        if not future.done():
+            future.set_exception(GenerationCancelled())
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, [])
+        if batch:
+            asyncio.create_task(self._run_batch(key, batch))
+
+    async def _run_batch(self, key: Tuple[str, str], batch: List[Entry]):
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+
+        # Генерация партии останавливается, только если отменены все её запросы
+        batch_token = SharedCancellationToken()
+        for _, _, token in batch:
+            batch_token.join(token)
+
+        strength, profile = key
+        texts = [text for text, _, _ in batch]
+        try:
+            results = await self.executor.run(
+                simplify_batch,
+                texts,
+                strength=strength,
+                profile=profile,
+                cancel_token=batch_token,
+                uses=SIMPLIFY_MODELS,
+                kind=JOB_CLAIM
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if len(batch) > 1:
+            logger.info(f"Микро-батч упрощения ({strength}, {profile}): {len(batch)} запросов")
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
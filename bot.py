@@ -6,9 +6,17 @@ import sys
 from dotenv import load_dotenv
 
 from telegram.ext import Application
-from download_model import download_and_setup_models
+from download_model import download_and_setup_models, SIMPLIFY_MODEL_PATH
 from handlers import setup_handlers
 from callbacks import setup_callbacks
+from inference import InferenceExecutor
+from concurrency import PerUserUpdateProcessor
+from batching import MicroBatcher
+from cache import ResultCache, TRANSLATION_MEMORY_ITEMS, TRANSLATION_MEMORY_PATH
+from speculative import SpeculativePrecomputer
+from cancellation import UserJobs
+from profiles import ProfileController
+from analysis import TextAnalyzer
 
 # Настройка логирования
 logging.basicConfig(
@@ -40,6 +48,13 @@ async def shutdown(application):
         await application.updater.stop()
         await application.stop()
         await application.shutdown()
+        inference = application.bot_data.get('inference')
+        if inference:
+            await inference.stop()
+        for cache_name in ('result_cache', 'translation_memory'):
+            cache = application.bot_data.get(cache_name)
+            if cache:
+                cache.close()
     except Exception as e:
         print(f"❌ Ошибка при завершении работы: {e}")
 
@@ -48,13 +63,38 @@ async def main():
         # Загрузка моделей
         models = await download_and_setup_models()
         
-        # Создание приложения
-        application = Application.builder().token(BOT_TOKEN).build()
+        # Создание приложения: обновления разных пользователей обрабатываются параллельно,
+        # новый запрос пользователя отменяет его текущую генерацию
+        user_jobs = UserJobs()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .concurrent_updates(PerUserUpdateProcessor(jobs=user_jobs))
+            .build()
+        )
         
         # Настройка обработчиков
         setup_handlers(application, models)
         setup_callbacks(application, models)
         
+        # Исполнитель инференса: модели работают вне event loop
+        inference = InferenceExecutor(models['models'])
+        await inference.start()
+        application.bot_data['inference'] = inference
+        application.bot_data['user_jobs'] = user_jobs
+        application.bot_data['profiles'] = ProfileController(inference)
+        application.bot_data['simplify_batcher'] = MicroBatcher(inference)
+        application.bot_data['result_cache'] = ResultCache("simplify_cache")
+        application.bot_data['translation_memory'] = ResultCache(
+            "translation_memory",
+            memory_items=TRANSLATION_MEMORY_ITEMS,
+            disk_items=TRANSLATION_MEMORY_ITEMS,
+            path=TRANSLATION_MEMORY_PATH
+        )
+        application.bot_data['speculative'] = SpeculativePrecomputer(application.bot_data)
+        # Разбор текста при получении; модель Punkt загружается здесь один раз
+        application.bot_data['analyzer'] = TextAnalyzer.from_pretrained(SIMPLIFY_MODEL_PATH)
+        
         print("🤖 Бот запущен...")
         print("💡 Для остановки бота нажмите Ctrl+C")
         
@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Настройки кэша результатов
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "512"))
+RESULT_CACHE_DISK_ITEMS = int(os.getenv("RESULT_CACHE_DISK_ITEMS", "20000"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))  # секунды, 0 — без ограничения
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "cache/results.sqlite3")  # пустая строка — только память
+# Записи на диск копятся в памяти и сбрасываются одним commit не чаще, чем раз в столько секунд
+RESULT_CACHE_FLUSH_SECONDS = float(os.getenv("RESULT_CACHE_FLUSH_SECONDS", "5"))
+
+# Настройки памяти переводов
+TRANSLATION_MEMORY_ITEMS = int(os.getenv("TRANSLATION_MEMORY_ITEMS", "5000"))
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "")  # пустая строка — только память
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def make_cache_key(text: str, operation: str, params: Dict[str, Any], revision: str) -> str:
+    """Хэш нормализованного текста, операции, параметров генерации и ревизии модели"""
+    payload = json.dumps(
+        [normalize_text(text), operation, params, revision],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """Двухуровневый кэш: LRU в памяти и SQLite на диске с ограничением по размеру и TTL.
+
+    Кэш вызывается из event loop, поэтому запись на диск отложенная: время доступа
+    запоминается в памяти, а новые записи и удаления попадают в открытую транзакцию.
+    Всё это сбрасывается одним commit раз в flush_seconds, при вытеснении и при close().
+    """
+
+    def __init__(self, name: str, memory_items: int = RESULT_CACHE_MEMORY_ITEMS,
+                 disk_items: int = RESULT_CACHE_DISK_ITEMS, ttl: int = RESULT_CACHE_TTL,
+                 path: Optional[str] = RESULT_CACHE_PATH, flush_seconds: float = RESULT_CACHE_FLUSH_SECONDS):
+        self.name = name
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+        self.flush_seconds = flush_seconds
+        self._accessed: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        metrics.register_rate(f"Попадания в `{name}`", f"{name}_hit", f"{name}_miss")
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.name} "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Дисковый кэш {path} недоступен, работаем только в памяти: {e}")
+                self._db = None
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.ttl) and time.time() - created > self.ttl
+
+    def get(self, key: str, record: bool = True) -> Optional[str]:
+        """Возвращает значение или None; record=False — не учитывать в счётчиках попаданий"""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                value, created = item
+                if not self._expired(created):
+                    self._memory.move_to_end(key)
+                    if record:
+                        metrics.inc(f"{self.name}_hit")
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f"SELECT value, created FROM {self.name} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created):
+                        self._accessed[key] = time.time()
+                        self._maybe_flush()
+                        self._remember(key, value, created)
+                        if record:
+                            metrics.inc(f"{self.name}_hit")
+                        return value
+                    self._db.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                    self._accessed.pop(key, None)
+                    self._maybe_flush()
+
+        if record:
+            metrics.inc(f"{self.name}_miss")
+        return None
+
+    def get_any(self, keys: Iterable[str], record: bool = True) -> Optional[str]:
+        """Первое найденное значение из нескольких ключей (в порядке предпочтения)"""
+        for key in keys:
+            value = self.get(key, record=False)
+            if value is not None:
+                if record:
+                    metrics.inc(f"{self.name}_hit")
+                return value
+        if record:
+            metrics.inc(f"{self.name}_miss")
+        return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.name} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._accessed.pop(key, None)
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._flush()
+                    self._evict_disk()
+                    self._db.commit()
+                else:
+                    self._maybe_flush()
+
+    def _remember(self, key: str, value: str, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self._flush()
+
+    def _flush(self):
+        """Записывает накопленное время доступа и фиксирует транзакцию"""
+        if self._accessed:
+            self._db.executemany(
+                f"UPDATE {self.name} SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()]
+            )
+            self._accessed.clear()
+        self._db.commit()
+        self._last_flush = time.monotonic()
+
+    def _evict_disk(self):
+        if self.ttl:
+            self._db.execute(f"DELETE FROM {self.name} WHERE created < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            f"DELETE FROM {self.name} WHERE key NOT IN "
+            f"(SELECT key FROM {self.name} ORDER BY accessed DESC LIMIT ?)",
+            (self.disk_items,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_items": len(self._memory),
+            "hit": metrics.counters.get(f"{self.name}_hit", 0),
+            "miss": metrics.counters.get(f"{self.name}_miss", 0),
+            "hit_rate_%": metrics.ratio(f"{self.name}_hit", f"{self.name}_miss")
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._flush()
+            self._db.close()
+            self._db = None
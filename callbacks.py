@@ -1,150 +1,165 @@
-import os
-import re
-import asyncio
-import random
 import logging
-from typing import Optional, List, Dict, Any
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, CallbackQueryHandler
 from utils import (
-    send_typing_action, safe_edit_message, send_thinking_messages,
-    split_text, simplify_text, translate_text, evaluate_simplification,
-    get_main_keyboard, get_simplify_keyboard
+    safe_edit_message, evaluate_simplification, get_main_keyboard, get_simplify_keyboard, send_text_document, LONG_OUTPUT_CHARS
 )
+import pipeline
+from progress import ProgressReporter
+from cancellation import GenerationCancelled
+from outbound import outbound
+
+CANCELLED_MESSAGE = "⏹ Запрос отменён: получен более новый."
 
 logger = logging.getLogger(__name__)
 
-async def simplify_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_result(query, title: str, body: str, name: str, footer: str = "", reply_markup=None):
+    """Короткий результат — в том же сообщении, длинный — отдельным файлом"""
+    if len(body) <= LONG_OUTPUT_CHARS:
+        await safe_edit_message(query, f"{title}\n\n{body}{footer}", reply_markup=reply_markup, parse_mode='Markdown')
+        return
+    await safe_edit_message(
+        query, f"{title}\n\n📎 Текст длинный — отправляю файлом.{footer}",
+        reply_markup=reply_markup, parse_mode='Markdown'
+    )
+    await send_text_document(query.message, body, name, title.replace("*", ""))
+
+async def simplify_claim(update: Update, context: ContextTypes.DEFAULT_TYPE, claim_index: int, strength: str = "medium"):
     query = update.callback_query
-    await query.answer()
-    
-    claim_index = int(query.data.split('_')[-1])
     claims = context.user_data.get('fact_check_claims', [])
     
     if not claims or claim_index >= len(claims):
-        await query.edit_message_text("❌ Утверждение не найдено.")
+        await safe_edit_message(query, "❌ Утверждение не найдено.")
         return
     
     claim = claims[claim_index]
+    page = context.user_data.get('fact_check_page', 0)
     
-    await query.edit_message_text(
-        f"📝 *Упрощение утверждения:*\n\n_{claim}_\n\n"
+    await safe_edit_message(
+        query,
+        f"📝 *Упрощение утверждения ({strength}):*\n\n_{claim}_\n\n"
         "⏳ Выполняется упрощение...",
         parse_mode='Markdown'
     )
     
     try:
-        # Используем модель упрощения с уровнем medium по умолчанию
-        simplified = simplify_text(
-            claim,
-            strength="medium",
-            simplify_tokenizer=context.bot_data['simplify_tokenizer'],
-            simplify_model=context.bot_data['simplify_model'],
-            device=context.bot_data['device']
-        )
+        with context.bot_data['user_jobs'].job(update.effective_user.id, update.update_id) as token:
+            simplified = await pipeline.simplify(context.bot_data, claim, strength=strength, cancel_token=token)
         
         result_text = (
-            f"📝 *Упрощенное утверждение:*\n\n"
+            f"📝 *Упрощенное утверждение ({strength}):*\n\n"
             f"{simplified}\n\n"
             f"📌 *Оригинал:*\n_{claim}_"
         )
         
         keyboard = [
             [
-                InlineKeyboardButton("🔄 Другой уровень", callback_data=f"change_claim_level_{claim_index}"),
-                InlineKeyboardButton("⬅️ Назад", callback_data="back_to_uploaded_text")
+                InlineKeyboardButton("🔄 Другой уровень", callback_data=f"fc:l:{claim_index}"),
+                InlineKeyboardButton("⬅️ К утверждениям", callback_data=f"fc:p:{page}")
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(
+        await safe_edit_message(
+            query,
             result_text,
             parse_mode='Markdown',
             reply_markup=reply_markup
         )
+    except GenerationCancelled:
+        await safe_edit_message(query, CANCELLED_MESSAGE)
     except Exception as e:
         logger.error(f"Ошибка упрощения утверждения: {e}")
-        await query.edit_message_text(f"❌ Ошибка при упрощении утверждения: {e}")
+        await safe_edit_message(query, f"❌ Ошибка при упрощении утверждения: {e}")
 
-async def change_claim_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def change_claim_level(update: Update, context: ContextTypes.DEFAULT_TYPE, claim_index: int):
     query = update.callback_query
-    await query.answer()
-    
-    claim_index = int(query.data.split('_')[-1])
     claims = context.user_data.get('fact_check_claims', [])
     
     if not claims or claim_index >= len(claims):
-        await query.edit_message_text("❌ Утверждение не найдено.")
+        await safe_edit_message(query, "❌ Утверждение не найдено.")
         return
     
-    # Сохраняем индекс утверждения для последующего использования
-    context.user_data['current_claim_index'] = claim_index
-    
     keyboard = [
         [
-            InlineKeyboardButton("⚖️ Средний", callback_data=f"simplify_claim_medium_{claim_index}"),
-            InlineKeyboardButton("🔥 Сильный", callback_data=f"simplify_claim_strong_{claim_index}")
+            InlineKeyboardButton("⚖️ Средний", callback_data=f"fc:s:{claim_index}:medium"),
+            InlineKeyboardButton("🔥 Сильный", callback_data=f"fc:s:{claim_index}:strong")
         ],
         [
-            InlineKeyboardButton("⬅️ Назад", callback_data="back_to_uploaded_text")
+            InlineKeyboardButton("⬅️ К утверждениям", callback_data=f"fc:p:{context.user_data.get('fact_check_page', 0)}")
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(
+    await safe_edit_message(
+        query,
         "Выбери уровень упрощения:",
         reply_markup=reply_markup
     )
 
-async def simplify_claim_with_strength(update: Update, context: ContextTypes.DEFAULT_TYPE, claim_index: int, strength: str):
+async def simplify_claims_bulk(update: Update, context: ContextTypes.DEFAULT_TYPE, selected_only: bool = False):
+    """Упрощает все (или только отмеченные) утверждения одним пакетом и присылает результаты вместе"""
     query = update.callback_query
-    await query.answer()
-    
     claims = context.user_data.get('fact_check_claims', [])
-    
-    if not claims or claim_index >= len(claims):
-        await query.edit_message_text("❌ Утверждение не найдено.")
+    if not claims:
+        await safe_edit_message(query, "❌ Нет утверждений для упрощения.")
         return
     
-    claim = claims[claim_index]
+    indices = sorted(i for i in context.user_data.get('selected_claims', ()) if i < len(claims)) if selected_only else []
+    if not indices:
+        indices = list(range(len(claims)))
     
-    await query.edit_message_text(
-        f"📝 *Упрощение утверждения ({strength}):*\n\n_{claim}_\n\n"
-        "⏳ Выполняется упрощение...",
-        parse_mode='Markdown'
-    )
+    await safe_edit_message(query, f"📝 Упрощаю утверждения ({len(indices)})...")
     
     try:
-        simplified = simplify_text(
-            claim,
-            strength=strength,
-            simplify_tokenizer=context.bot_data['simplify_tokenizer'],
-            simplify_model=context.bot_data['simplify_model'],
-            device=context.bot_data['device']
-        )
-        
-        result_text = (
-            f"📝 *Упрощенное утверждение ({strength}):*\n\n"
-            f"{simplified}\n\n"
-            f"📌 *Оригинал:*\n_{claim}_"
-        )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔄 Другой уровень", callback_data=f"change_claim_level_{claim_index}"),
-                InlineKeyboardButton("⬅️ Назад", callback_data="back_to_uploaded_text")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            result_text,
-            parse_mode='Markdown',
-            reply_markup=reply_markup
-        )
+        with context.bot_data['user_jobs'].job(update.effective_user.id, update.update_id) as token:
+            simplified = await pipeline.simplify_many(
+                context.bot_data, [claims[i] for i in indices], strength="medium", cancel_token=token
+            )
+    except GenerationCancelled:
+        await safe_edit_message(query, CANCELLED_MESSAGE)
+        return
     except Exception as e:
-        logger.error(f"Ошибка упрощения утверждения: {e}")
-        await query.edit_message_text(f"❌ Ошибка при упрощении утверждения: {e}")
+        logger.error(f"Ошибка упрощения утверждений: {e}")
+        await safe_edit_message(query, f"❌ Ошибка при упрощении утверждений: {e}")
+        return
+    
+    context.user_data['selected_claims'] = set()
+    
+    reply_markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("⬅️ К утверждениям", callback_data=f"fc:p:{context.user_data.get('fact_check_page', 0)}")]
+    ])
+    body = "\n\n".join(f"{i + 1}. {result}" for i, result in zip(indices, simplified))
+    await show_result(
+        query, f"📝 *Упрощённые утверждения ({len(indices)}):*", body, "claims", reply_markup=reply_markup
+    )
+
+async def handle_fact_check_action(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Кнопки страницы фактчекинга: fc:<действие>[:<номер>[:<уровень>]]"""
+    from handlers import show_fact_check_page
+    _, action, *args = data.split(":")
+    
+    if action == "p":
+        await show_fact_check_page(update, context, int(args[0]))
+    elif action == "s":
+        await simplify_claim(update, context, int(args[0]), args[1] if len(args) > 1 else "medium")
+    elif action == "l":
+        await change_claim_level(update, context, int(args[0]))
+    elif action == "t":
+        # Отметка утверждения для упрощения вместе с другими; страница перерисовывается
+        claim_index = int(args[0])
+        selected = context.user_data.setdefault('selected_claims', set())
+        if claim_index in selected:
+            selected.discard(claim_index)
+        else:
+            selected.add(claim_index)
+        await show_fact_check_page(update, context)
+    elif action == "all":
+        await simplify_claims_bulk(update, context)
+    elif action == "sel":
+        await simplify_claims_bulk(update, context, selected_only=True)
+    elif action != "noop":
+        logger.warning(f"Unknown fact-check action: {data}")
 
 async def show_last_uploaded_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -160,19 +175,13 @@ async def show_last_uploaded_text(update: Update, context: ContextTypes.DEFAULT_
     except Exception as e:
         logger.warning(f"Error deleting message: {e}")
     
-    max_length = 4096 - 100
-    if len(text) <= max_length:
-        await query.message.reply_text(
+    if len(text) <= LONG_OUTPUT_CHARS:
+        await outbound.reply(query.message,
             f"📜 *Последний загруженный текст:*\n\n{text}",
             parse_mode='Markdown'
         )
     else:
-        parts = split_text(text, max_chars=3500)
-        for i, part in enumerate(parts):
-            if part.strip():
-                text_part = f"📜 *Последний загруженный текст (часть {i+1}):*\n\n{part}"
-                await query.message.reply_text(text_part, parse_mode='Markdown')
-                await asyncio.sleep(0.5)
+        await send_text_document(query.message, text, "original", "📜 Последний загруженный текст")
     
     # Добавляем кнопки для действий с текстом
     keyboard = [
@@ -182,7 +191,7 @@ async def show_last_uploaded_text(update: Update, context: ContextTypes.DEFAULT_
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.message.reply_text(
+    await outbound.reply(query.message,
         "Выбери действие:",
         reply_markup=reply_markup
     )
@@ -198,8 +207,11 @@ async def fact_check_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "1. Отправьте текст или загрузите файл\n"
         "2. Выберите режим 'Фактчекинг'\n"
         "3. Бот разобьет текст на утверждения\n"
-        "4. Для каждого утверждения доступны действия:\n"
-        "   • 📝 *Упростить* - упростить утверждение\n\n"
+        "4. Утверждения показываются по страницам, листайте кнопками ◀️ ▶️\n"
+        "5. Для каждого утверждения доступны действия:\n"
+        "   • 📝 *Упростить* - упростить утверждение\n"
+        "   • ☑️ *Выбрать* - отметить для упрощения вместе с другими\n"
+        "6. Кнопки *Упростить все* и *Упростить выбранные* упрощают утверждения за один раз\n\n"
         "⚠️ *Важно:*\n"
         "• Бот не заменяет профессиональную экспертизу\n"
         "• Результаты носят рекомендательный характер\n"
@@ -212,7 +224,7 @@ async def fact_check_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
+    await outbound.edit(query,
         help_text,
         parse_mode='Markdown',
         reply_markup=reply_markup
@@ -247,7 +259,7 @@ async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
+    await outbound.edit(query,
         help_text,
         parse_mode='Markdown',
         reply_markup=reply_markup
@@ -269,11 +281,9 @@ async def handle_back_to_simplified(update: Update, context: ContextTypes.DEFAUL
     }
     strength_name = strength_names.get(strength, 'средний')
     
-    await safe_edit_message(
-        query,
-        f"✅ *Упрощённый текст ({strength_name}):*\n\n{simplified}",
-        reply_markup=get_simplify_keyboard(),
-        parse_mode='Markdown'
+    await show_result(
+        query, f"✅ *Упрощённый текст ({strength_name}):*", simplified, f"simplified_{strength}",
+        reply_markup=get_simplify_keyboard()
     )
 
 async def handle_simplify(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -286,39 +296,18 @@ async def handle_simplify(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await safe_edit_message(query, "❌ Не найден текст для упрощения.")
         return
     
-    await safe_edit_message(query, f"🔄 Упрощаю текст ({strength} уровень)...")
-    
-    if len(text) > 2000:
-        parts = split_text(text, 1500)
-        total_parts = len(parts)
-        for i, part in enumerate(parts):
-            if part.strip():
-                progress = (i + 1) / total_parts * 100
-                await safe_edit_message(
-                    query,
-                    f"🔄 Упрощаю текст ({strength} уровень)...\n\n"
-                    f"Прогресс: {i+1}/{total_parts} частей ({progress:.0f}%)"
-                )
-                await asyncio.sleep(0.5)
-    
-    thinking_messages = [
-        "🧠 Анализирую структуру текста...",
-        "✍️ Упрощаю с сохранением смысла...",
-        "🔍 Переписываю — чтобы было ясно...",
-        "🧩 Готовлю результат...",
-        "✅ Почти готово!"
-    ]
-    random.shuffle(thinking_messages)
-    await send_thinking_messages(query, thinking_messages)
+    header = f"🔄 Упрощаю текст ({strength} уровень)..."
+    await safe_edit_message(query, header)
     
+    progress = ProgressReporter(query, header)
     try:
-        simplified = simplify_long_text(
-            text,
-            strength=strength,
-            simplify_tokenizer=context.bot_data['simplify_tokenizer'],
-            simplify_model=context.bot_data['simplify_model'],
-            device=context.bot_data['device']
-        )
+        with context.bot_data['user_jobs'].job(update.effective_user.id, update.update_id) as token:
+            simplified = await pipeline.simplify(
+                context.bot_data, text, strength=strength, progress=progress, cancel_token=token,
+                session=context.user_data.setdefault('simplify_sessions', {}),
+                analysis=context.user_data.get('analysis')
+            )
+        await progress.close()
         
         context.user_data['simplified_text'] = simplified
         context.user_data['last_strength'] = strength
@@ -331,10 +320,6 @@ async def handle_simplify(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"💡 {metrics['quality_hint']}"
         )
         
-        warning = ""
-        if len(simplified.split()) > 300:
-            warning = "\n\n⚠️ *Внимание:* текст длинный — мог быть частично обрезан."
-        
         # Обновленная клавиатура без кнопки "Фактчекинг"
         keyboard = [
             [InlineKeyboardButton("🔤 Перевести на английский", callback_data="translate")],
@@ -343,13 +328,16 @@ async def handle_simplify(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await safe_edit_message(
-            query,
-            f"✅ *Упрощённый текст ({strength}):*\n\n{simplified}{quality_info}{warning}",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
+        await show_result(
+            query, f"✅ *Упрощённый текст ({strength}):*", simplified, f"simplified_{strength}",
+            footer=quality_info, reply_markup=reply_markup
         )
+    except GenerationCancelled:
+        await progress.close()
+        logger.info(f"Simplification cancelled for user {update.effective_user.id}")
+        await safe_edit_message(query, CANCELLED_MESSAGE)
     except Exception as e:
+        await progress.close()
         logger.error(f"Simplification error: {e}")
         await safe_edit_message(query, f"❌ Ошибка при упрощении текста: {e}")
 
@@ -361,30 +349,33 @@ async def handle_translate(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await safe_edit_message(query, "❌ Нет текста для перевода.")
         return
     
-    await safe_edit_message(query, "🔤 Перевожу на английский...")
+    header = "🔤 Перевожу на английский..."
+    await safe_edit_message(query, header)
     
+    progress = ProgressReporter(query, header)
     try:
-        translated = translate_text(
-            simplified,
-            translator_tokenizer=context.bot_data['translator_tokenizer'],
-            translator_model=context.bot_data['translator_model'],
-            bert_tokenizer=context.bot_data['bert_tokenizer'],
-            bert_model=context.bot_data['bert_model'],
-            device=context.bot_data['device']
-        )
+        with context.bot_data['user_jobs'].job(update.effective_user.id, update.update_id) as token:
+            # Упрощённый текст на том же языке, что и исходный
+            analysis = context.user_data.get('analysis') or {}
+            translated = await pipeline.translate(
+                context.bot_data, simplified, progress=progress, cancel_token=token, lang=analysis.get('language')
+            )
+        await progress.close()
         
         keyboard = [
             [InlineKeyboardButton("⬅️ Назад к упрощённому", callback_data="back_to_simplified")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await safe_edit_message(
-            query,
-            f"🇬🇧 *Перевод на английский:*\n\n{translated}",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
+        await show_result(
+            query, "🇬🇧 *Перевод на английский:*", translated, "translation", reply_markup=reply_markup
         )
+    except GenerationCancelled:
+        await progress.close()
+        logger.info(f"Translation cancelled for user {update.effective_user.id}")
+        await safe_edit_message(query, CANCELLED_MESSAGE)
     except Exception as e:
+        await progress.close()
         logger.error(f"Translation error: {e}")
         await safe_edit_message(query, f"❌ Ошибка перевода: {e}")
 
@@ -395,7 +386,7 @@ async def handle_change_level(update: Update, context: ContextTypes.DEFAULT_TYPE
         await safe_edit_message(query, "❌ Нет текста для упрощения. Отправьте текст или файл сначала.")
         return
     
-    await query.message.reply_text(
+    await outbound.reply(query.message,
         "🔄 *Новый уровень упрощения*\nВыбери другой вариант:",
         parse_mode='Markdown',
         reply_markup=InlineKeyboardMarkup([
@@ -419,23 +410,17 @@ async def handle_show_original(update: Update, context: ContextTypes.DEFAULT_TYP
     except Exception as e:
         logger.warning(f"Error deleting message: {e}")
     
-    max_length = 4096 - 100
-    if len(original) <= max_length:
-        await query.message.reply_text(
+    if len(original) <= LONG_OUTPUT_CHARS:
+        await outbound.reply(query.message,
             f"📜 *Оригинальный текст:*\n\n{original}",
             parse_mode='Markdown'
         )
     else:
-        parts = split_text(original, max_chars=3500)
-        for i, part in enumerate(parts):
-            if part.strip():
-                text = f"📜 *Оригинальный текст (часть {i+1}):*\n\n{part}"
-                await query.message.reply_text(text, parse_mode='Markdown')
-                await asyncio.sleep(0.5)
+        await send_text_document(query.message, original, "original", "📜 Оригинальный текст")
     
     keyboard = [[InlineKeyboardButton("⬅️ Назад к упрощённому", callback_data="back_to_simplified")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(
+    await outbound.reply(query.message,
         "Хочешь вернуться к упрощённому тексту?",
         reply_markup=reply_markup
     )
@@ -448,21 +433,17 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     logger.info(f"User {user_id} clicked: {data}")
     
-    if data.startswith("simplify_claim_"):
-        await simplify_claim(update, context)
-    elif data.startswith("change_claim_level_"):
-        await change_claim_level(update, context)
-    elif data.startswith("simplify_claim_medium_") or data.startswith("simplify_claim_strong_"):
-        # Извлекаем индекс утверждения и уровень
-        parts = data.split('_')
-        strength = parts[2]
-        claim_index = int(parts[3])
-        await simplify_claim_with_strength(update, context, claim_index, strength)
+    if data.startswith("fc:"):
+        await handle_fact_check_action(update, context, data)
+    elif data.startswith(("simplify_claim_", "change_claim_level_")):
+        # Кнопки из сообщений старого формата (по одному сообщению на утверждение)
+        await safe_edit_message(query, "ℹ️ Эта кнопка устарела. Откройте фактчекинг заново.")
     elif data == "back_to_uploaded_text":
         await show_last_uploaded_text(update, context)
     elif data == "back_to_fact_check":
-        from handlers import fact_checking_mode
-        await fact_checking_mode(update, context)
+        # Возврат к той же странице без повторного разбора и рассылки
+        from handlers import show_fact_check_page
+        await show_fact_check_page(update, context)
     elif data == "fact_check_help":
         await fact_check_help(update, context)
     elif data == "fact_checking":
@@ -480,7 +461,7 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await handle_show_original(update, context)
     elif data == "back_to_main":
         keyboard = get_main_keyboard()
-        await query.message.reply_text(
+        await outbound.reply(query.message,
             "Выбери действие:",
             reply_markup=keyboard
         )
@@ -491,10 +472,10 @@ async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await start(update, context)
     else:
         logger.warning(f"Unknown callback data: {data}")
-        await query.edit_message_text("❌ Неизвестное действие")
+        await outbound.edit(query, "❌ Неизвестное действие")
 
 def setup_callbacks(application, models):
-    # Сохраняем модели в bot_data для доступа из обработчиков
+    # Реестр моделей и их ревизии доступны обработчикам через bot_data
     application.bot_data.update(models)
     
     # Добавляем обработчик кнопок
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from telegram import Update
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class GenerationCancelled(Exception):
+    """Генерация отменена более новым запросом пользователя"""
+
+class CancellationToken:
+    """Флаг отмены, который проверяется между частями текста и между шагами декодирования"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Ошибка в обработчике отмены: {e}")
+
+    def add_callback(self, callback: Callable[[], Any]):
+        """Вызывает callback при отмене (сразу, если токен уже отменён)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise GenerationCancelled()
+
+class SharedCancellationToken(CancellationToken):
+    """Общий токен для работы, которую ждут несколько участников.
+
+    Отменяется, только когда отменены все присоединившиеся участники.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._members = 0
+
+    def join(self, token: Optional[CancellationToken] = None) -> Callable[[], None]:
+        """Добавляет участника; возвращает функцию для его выхода"""
+        with self._lock:
+            self._members += 1
+        left = False
+
+        def leave():
+            nonlocal left
+            with self._lock:
+                if left:
+                    return
+                left = True
+                self._members -= 1
+                last = self._members == 0
+            if last:
+                self.cancel()
+
+        if token is not None:
+            token.add_callback(leave)
+        return leave
+
+async def wait_cancellable(awaitable: asyncio.Future, token: Optional[CancellationToken] = None,
+                           on_leave: Optional[Callable[[], None]] = None):
+    """Ждёт общий результат, но прекращает ожидание при отмене собственного токена"""
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    if token is not None:
+        token.add_callback(lambda: loop.call_soon_threadsafe(
+            lambda: stopped.done() or stopped.set_result(None)
+        ))
+    try:
+        await asyncio.wait({awaitable, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        if on_leave is not None:
+            on_leave()
+        raise
+    finally:
+        if not stopped.done():
+            stopped.cancel()
+    if awaitable.done():
+        return awaitable.result()
+    raise GenerationCancelled()
+
+# Кнопки, которые запускают генерацию (упрощение, перевод, упрощение утверждений фактчекинга)
+SUPERSEDING_CALLBACKS = ("simplify_", "translate", "fc:s:", "fc:all", "fc:sel")
+
+def is_superseding_update(update: object) -> bool:
+    """Новый текст или запуск генерации делает прежнюю генерацию пользователя ненужной"""
+    if not isinstance(update, Update):
+        return False
+    if update.message and (update.message.text or update.message.document):
+        return not (update.message.text or "").startswith("/")
+    if update.callback_query and update.callback_query.data:
+        return update.callback_query.data.startswith(SUPERSEDING_CALLBACKS)
+    return False
+
+class UserJobs:
+    """Текущая генерация каждого пользователя; новый запрос отменяет предыдущий"""
+
+    def __init__(self):
+        self._tokens: Dict[int, CancellationToken] = {}
+        self._latest: Dict[int, int] = {}
+        self._update_seq: Dict[int, int] = {}
+
+    def supersede(self, user_id: int, update_id: int):
+        """Вызывается при получении обновления, ещё до очереди пользователя"""
+        seq = self._latest.get(user_id, 0) + 1
+        self._latest[user_id] = seq
+        self._update_seq[update_id] = seq
+        self._cancel_current(user_id)
+
+    def forget(self, update_id: int):
+        self._update_seq.pop(update_id, None)
+
+    def begin(self, user_id: int, update_id: int) -> CancellationToken:
+        token = CancellationToken()
+        seq = self._update_seq.pop(update_id, None)
+        if seq is not None and seq < self._latest.get(user_id, 0):
+            # Пока запрос ждал своей очереди, пришёл более новый
+            metrics.inc("jobs_superseded")
+            token.cancel()
+            return token
+        self._cancel_current(user_id)
+        self._tokens[user_id] = token
+        return token
+
+    def end(self, user_id: int, token: CancellationToken):
+        if self._tokens.get(user_id) is token:
+            del self._tokens[user_id]
+
+    @contextmanager
+    def job(self, user_id: int, update_id: int):
+        token = self.begin(user_id, update_id)
+        try:
+            yield token
+        finally:
+            self.end(user_id, token)
+
+    def _cancel_current(self, user_id: int):
+        token = self._tokens.pop(user_id, None)
+        if token is not None and not token.cancelled:
+            metrics.inc("jobs_superseded")
+            token.cancel()
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from metrics import metrics
+from cancellation import CancellationToken, SharedCancellationToken, wait_cancellable
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Объединяет одинаковые запросы, которые выполняются одновременно.
+
+    Первый запрос с данным ключом запускает работу, остальные ждут её результат
+    вместо того, чтобы ставить ещё одну генерацию в очередь. Работа получает
+    общий токен отмены, который срабатывает, только когда отменились все участники.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, Tuple[asyncio.Task, SharedCancellationToken]] = {}
+        metrics.register_rate(f"Объединённые запросы `{name}`", f"{name}_coalesced", f"{name}_leader")
+
+    async def do(self, key: str, factory: Callable[[CancellationToken], Awaitable[Any]],
+                 cancel_token: Optional[CancellationToken] = None) -> Any:
+        flight = self._calls.get(key)
+        if flight is not None and not flight[1].cancelled:
+            metrics.inc(f"{self.name}_coalesced")
+        else:
+            metrics.inc(f"{self.name}_leader")
+            shared = SharedCancellationToken()
+            task = asyncio.create_task(factory(shared))
+            flight = (task, shared)
+            self._calls[key] = flight
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        task, shared = flight
+        leave = shared.join(cancel_token)
+        return await wait_cancellable(task, cancel_token, on_leave=leave)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        flight = self._calls.get(key)
+        if flight is not None and flight[0] is task:
+            del self._calls[key]
+        # Помечаем исключение как полученное, даже если никто больше не ждёт
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,74 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Dict, Hashable, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from cancellation import UserJobs, is_superseding_update
+
+logger = logging.getLogger(__name__)
+
+# Глобальный лимит одновременно обрабатываемых обновлений
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных пользователей.
+
+    Обновления одного пользователя выполняются строго по очереди, чтобы
+    ключи context.user_data (pending_text, simplified_text и т.д.) не гонялись.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES, jobs: Optional[UserJobs] = None):
+        super().__init__(max_concurrent_updates)
+        self.jobs = jobs
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._pending: Dict[Hashable, int] = {}
+
+    @staticmethod
+    def _key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        """Ожидание своей очереди не занимает глобальный слот.
+
+        Базовый класс берёт семафор до do_process_update, и тогда несколько обновлений
+        одного пользователя, стоящих за блокировкой, заняли бы все слоты.
+        """
+        key = self._key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # Новый запрос отменяет текущую генерацию пользователя, не дожидаясь своей очереди
+        superseding = self.jobs is not None and is_superseding_update(update)
+        if superseding:
+            self.jobs.supersede(key, update.update_id)
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            if superseding:
+                self.jobs.forget(update.update_id)
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
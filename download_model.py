@@ -1,11 +1,16 @@
 import os
+import hashlib
 import torch
 import requests
 from shutil import rmtree
 from zipfile import ZipFile
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, BertTokenizer, BertModel
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSeq2SeqLM, BertTokenizer, BertModel
 from dotenv import load_dotenv
 
+from backends import BACKEND_TORCH, SIMPLIFY_BACKEND, TRANSLATE_BACKEND, check_backend, load_backend_model
+from quantization import MODEL_QUANTIZATION, QUANTIZATION_NONE, effective_quantization, load_quantized_model
+from registry import ModelRegistry
+
 load_dotenv()
 
 # Настройка устройства
@@ -16,6 +21,11 @@ print(f"✅ Используем устройство: {device}")
 MODEL_DIR = os.getenv("MODEL_PATH", "/content/rut5_simplifier_new")
 ZIP_PATH = "/content/rut5_simplifier.zip"
 PUBLIC_LINK = "https://disk.yandex.ru/d/GcR3ougL6bY6kw"
+SIMPLIFY_MODEL_PATH = os.path.join(MODEL_DIR, "rut5_simplifier")
+TRANSLATE_MODEL_NAME = "Helsinki-NLP/opus-mt-ru-en"
+BERT_MODEL_NAME = "bert-base-multilingual-cased"
+# Сконвертированные модели для onnxruntime / ctranslate2 хранятся рядом с MODEL_DIR
+CONVERTED_MODEL_DIR = os.getenv("CONVERTED_MODEL_PATH", MODEL_DIR.rstrip("/") + "_converted")
 
 # Функция загрузки с Яндекс.Диска
 def download_from_yandex_disk(public_url, output_path):
@@ -41,11 +51,48 @@ def extract_model(zip_path, extract_to):
         zip_ref.extractall(extract_to)
     print(f"✅ Модель распакована в: {extract_to}")
 
+# Ревизия модели: меняется при замене весов (используется в ключах кэша)
+def get_model_revision(model_path, config):
+    commit_hash = getattr(config, "_commit_hash", None)
+    if commit_hash:
+        return commit_hash
+    fingerprint = []
+    for file_name in ('config.json', 'pytorch_model.bin', 'model.safetensors'):
+        file_path = os.path.join(model_path, file_name)
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            fingerprint.append(f"{file_name}:{stat.st_size}:{int(stat.st_mtime)}")
+    return hashlib.sha1("|".join(fingerprint or [model_path]).encode("utf-8")).hexdigest()[:12]
+
+# Ревизия с учётом движка и квантизации (используется в ключах кэша, модель не загружается)
+def get_serving_revision(model_path, backend=BACKEND_TORCH):
+    revision = get_model_revision(model_path, AutoConfig.from_pretrained(model_path))
+    if backend != BACKEND_TORCH:
+        # Другой движок даёт немного другие результаты — у них свои записи в кэше
+        return f"{revision}+{backend}"
+    mode = effective_quantization(MODEL_QUANTIZATION)
+    if device == "cpu" and mode != QUANTIZATION_NONE:
+        return f"{revision}+{mode}"
+    return revision
+
 # Функция загрузки моделей
-def load_model(model_path, model_type):
+def load_model(model_path, model_type, name, backend=BACKEND_TORCH):
     try:
-        print(f"📥 Загружаем {model_type} модель из: {model_path}")
+        check_backend(backend)
+        print(f"📥 Загружаем {model_type} модель из: {model_path} (бэкенд {backend})")
         tokenizer = AutoTokenizer.from_pretrained(model_path)
+        revision = get_model_revision(model_path, AutoConfig.from_pretrained(model_path))
+        if backend != BACKEND_TORCH:
+            model = load_backend_model(name, model_path, tokenizer, backend, device, CONVERTED_MODEL_DIR, revision)
+            print(f"✅ {model_type} модель загружена")
+            return tokenizer, model
+
+        if device == "cpu" and MODEL_QUANTIZATION != QUANTIZATION_NONE:
+            # На CPU модель квантизуется один раз, дальше загружается из кэша
+            model, mode = load_quantized_model(name, model_path, revision, MODEL_QUANTIZATION, CONVERTED_MODEL_DIR)
+            print(f"✅ {model_type} модель загружена ({mode})")
+            return tokenizer, model
+
         model = AutoModelForSeq2SeqLM.from_pretrained(model_path).to(device)
         
         # Оптимизация для GPU
@@ -81,8 +128,7 @@ async def download_and_setup_models():
         print(f"✅ Модель уже существует: {MODEL_DIR}")
     
     # Явное указание пути к модели
-    MODEL_SUBDIR = "rut5_simplifier"
-    MODEL_PATH = os.path.join(MODEL_DIR, MODEL_SUBDIR)
+    MODEL_PATH = SIMPLIFY_MODEL_PATH
     if not os.path.exists(MODEL_PATH):
         raise RuntimeError(f"❌ Папка модели не найдена: {MODEL_PATH}")
     print(f"✅ Используем путь к модели: {MODEL_PATH}")
@@ -112,23 +158,32 @@ async def download_and_setup_models():
         raise RuntimeError(f"❌ В папке модели отсутствуют файлы: {missing_files}")
     print("✅ Все необходимые файлы модели присутствуют")
     
-    # Загрузка моделей
-    try:
-        simplify_tokenizer, simplify_model = load_model(MODEL_PATH, "упрощения")
-    except Exception as e:
-        raise RuntimeError(f"❌ Критическая ошибка при загрузке модели упрощения: {e}")
-    
-    TRANSLATE_MODEL_NAME = "Helsinki-NLP/opus-mt-ru-en"
-    try:
-        translator_tokenizer, translator_model = load_model(TRANSLATE_MODEL_NAME, "перевода")
-    except Exception as e:
-        raise RuntimeError(f"❌ Критическая ошибка при загрузке модели перевода: {e}")
-    
-    # Инициализация BERT
-    bert_model_name = "bert-base-multilingual-cased"
-    bert_tokenizer = BertTokenizer.from_pretrained(bert_model_name)
-    bert_model = BertModel.from_pretrained(bert_model_name)
-    bert_model.to(device)
+    # Модели загружаются реестром при первом использовании
+    def load_simplifier():
+        try:
+            tokenizer, model = load_model(MODEL_PATH, "упрощения", "simplify", SIMPLIFY_BACKEND)
+        except Exception as e:
+            raise RuntimeError(f"❌ Критическая ошибка при загрузке модели упрощения: {e}")
+        return {'simplify_tokenizer': tokenizer, 'simplify_model': model}
+
+    def load_translator():
+        try:
+            tokenizer, model = load_model(TRANSLATE_MODEL_NAME, "перевода", "translator", TRANSLATE_BACKEND)
+        except Exception as e:
+            raise RuntimeError(f"❌ Критическая ошибка при загрузке модели перевода: {e}")
+        return {'translator_tokenizer': tokenizer, 'translator_model': model}
+
+    def load_bert():
+        # Инициализация BERT
+        bert_tokenizer = BertTokenizer.from_pretrained(BERT_MODEL_NAME)
+        bert_model = BertModel.from_pretrained(BERT_MODEL_NAME)
+        bert_model.to(device)
+        return {'bert_tokenizer': bert_tokenizer, 'bert_model': bert_model}
+
+    registry = ModelRegistry(constants={'device': device})
+    registry.register("simplify", ('simplify_tokenizer', 'simplify_model'), load_simplifier)
+    registry.register("translator", ('translator_tokenizer', 'translator_model'), load_translator)
+    registry.register("bert", ('bert_tokenizer', 'bert_model'), load_bert)
     
     # Оптимизация для Colab
     torch.backends.cuda.max_split_size_mb = 512
@@ -136,14 +191,10 @@ async def download_and_setup_models():
         torch.cuda.empty_cache()
         print(f"🧹 Очищен кэш CUDA. Свободно памяти: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
     
-    print("✅ Все модели успешно загружены")
+    print("✅ Реестр моделей готов")
     
     return {
-        'simplify_tokenizer': simplify_tokenizer,
-        'simplify_model': simplify_model,
-        'translator_tokenizer': translator_tokenizer,
-        'translator_model': translator_model,
-        'bert_tokenizer': bert_tokenizer,
-        'bert_model': bert_model,
-        'device': device
-    }
\ No newline at end of file
+        'models': registry,
+        'simplify_revision': get_serving_revision(MODEL_PATH, SIMPLIFY_BACKEND),
+        'translator_revision': get_serving_revision(TRANSLATE_MODEL_NAME, TRANSLATE_BACKEND)
+    }
@@ -1,25 +1,28 @@
 import os
 import re
+import asyncio
 import tempfile
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, Dict, Any
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    Application, CommandHandler, MessageHandler,
-    CallbackQueryHandler, ContextTypes, filters
-)
+from telegram.ext import CommandHandler, MessageHandler, ContextTypes, filters
 from utils import (
-    MAX_TEXT_LENGTH, MAX_FILE_SIZE, MAX_PARTS_FOR_WARNING,
-    send_typing_action, safe_delete_file, read_txt_file, read_docx_file,
-    split_text, simplify_long_text, translate_text, evaluate_simplification,
-    get_main_keyboard, get_simplify_keyboard
+    MAX_TEXT_LENGTH, MAX_FILE_SIZE, MAX_PARTS_FOR_WARNING, estimate_simplify_parts,
+    send_typing_action, safe_edit_message, safe_delete_file, read_txt_file, read_docx_file,
+    get_main_keyboard
 )
+from metrics import metrics
+from analysis import analysis_for
+from outbound import outbound
 
 logger = logging.getLogger(__name__)
 
+# Telegram ID пользователей, которым доступна /stats (через запятую); пусто — метрики только в логе
+STATS_ADMIN_IDS = {int(user_id) for user_id in os.getenv("STATS_ADMIN_IDS", "").split(",") if user_id.strip()}
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_typing_action(update, context)
-    await update.message.reply_text(
+    await outbound.reply(update.message,
         "👋 Привет! Я — *TextEaseBot*.\n\n"
         "📌 Я помогаю:\n"
         "• Упрощать сложные тексты\n"
@@ -42,41 +45,49 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def show_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает главное меню"""
     keyboard = get_main_keyboard()
-    await update.message.reply_text(
+    await outbound.reply(update.message,
         "Выбери действие:",
         reply_markup=keyboard
     )
 
+async def analyze_text(context: ContextTypes.DEFAULT_TYPE, text: str) -> Dict[str, Any]:
+    """Разбор текста один раз при получении (предложения, язык, токены) — вне event loop"""
+    return await asyncio.to_thread(context.bot_data['analyzer'].analyze, text)
+
+async def warn_if_long(update: Update, text: str, analysis: Dict[str, Any]):
+    """Предупреждает о длительной обработке; число частей — по токенам из разбора текста"""
+    estimated_parts = estimate_simplify_parts(text, "medium", analysis)
+    if estimated_parts > MAX_PARTS_FOR_WARNING:
+        await outbound.reply(update.message,
+            f"⚠️ Текст довольно длинный ({len(text)} символов, около {estimated_parts} частей).\n"
+            f"Обработка может занять {estimated_parts * 5} секунд.\n"
+            f"Продолжить?"
+        )
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_typing_action(update, context)
     text = update.message.text.strip()
     
     if not text:
-        await update.message.reply_text("❌ Пустое сообщение. Отправь текст или файл.")
+        await outbound.reply(update.message, "❌ Пустое сообщение. Отправь текст или файл.")
         return
     
     # Проверка длины текста
     if len(text) > MAX_TEXT_LENGTH:
-        await update.message.reply_text(
+        await outbound.reply(update.message,
             f"❌ Текст слишком длинный ({len(text)} символов).\n"
             f"Максимальная длина: {MAX_TEXT_LENGTH} символов.\n\n"
             "💡 Пожалуйста, сократите текст или разделите на части."
         )
         return
     
-    # Предупреждение о длительной обработке
-    estimated_parts = len(text) // 1500 + 1
-    if estimated_parts > MAX_PARTS_FOR_WARNING:
-        await update.message.reply_text(
-            f"⚠️ Текст довольно длинный ({len(text)} символов).\n"
-            f"Обработка может занять {estimated_parts * 5} секунд.\n"
-            f"Продолжить?"
-        )
-    
     context.user_data['pending_text'] = text
     context.user_data['source_type'] = 'text'
+    context.user_data['analysis'] = await analyze_text(context, text)
+    await warn_if_long(update, text, context.user_data['analysis'])
+    context.bot_data['speculative'].start(update.effective_user.id, text)
     
-    await update.message.reply_text(
+    await outbound.reply(update.message,
         f"📝 Получен текст ({len(text)} символов).\n"
         "Выбери действие:",
         reply_markup=InlineKeyboardMarkup([
@@ -94,7 +105,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Проверка формата файла
     if not any(file_name.endswith(ext) for ext in {".txt", ".docx"}):
-        await update.message.reply_text(
+        await outbound.reply(update.message,
             "❌ Неподдерживаемый формат.\n"
             "Поддерживаются: .txt, .docx"
         )
@@ -102,7 +113,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Проверка размера файла
     if doc.file_size > MAX_FILE_SIZE:
-        await update.message.reply_text(
+        await outbound.reply(update.message,
             f"❌ Слишком большой файл.\n"
             f"Максимальный размер: {MAX_FILE_SIZE // (1024*1024)} МБ"
         )
@@ -127,38 +138,33 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text = None
         
         if text is None:
-            await update.message.reply_text(
+            await outbound.reply(update.message,
                 "❌ Ошибка чтения файла.\n"
                 "Проверьте целостность файла и попробуйте снова."
             )
             return
         
         if not text.strip():
-            await update.message.reply_text("❌ Файл пустой.")
+            await outbound.reply(update.message, "❌ Файл пустой.")
             return
         
         # Проверка длины текста
         if len(text) > MAX_TEXT_LENGTH:
-            await update.message.reply_text(
+            await outbound.reply(update.message,
                 f"❌ Текст слишком длинный ({len(text)} символов).\n"
                 f"Максимальная длина: {MAX_TEXT_LENGTH} символов.\n\n"
                 "💡 Пожалуйста, сократите текст или разделите на части."
             )
             return
         
-        # Предупреждение о длительной обработке
-        estimated_parts = len(text) // 1500 + 1
-        if estimated_parts > MAX_PARTS_FOR_WARNING:
-            await update.message.reply_text(
-                f"⚠️ Текст довольно длинный ({len(text)} символов).\n"
-                f"Обработка может занять {estimated_parts * 5} секунд.\n"
-                f"Продолжить?"
-            )
-        
         context.user_data['pending_text'] = text
         context.user_data['source_type'] = 'document'
+        # Обработчики берут текст без крайних пробелов, разбор должен совпадать с ним
+        context.user_data['analysis'] = await analyze_text(context, text.strip())
+        await warn_if_long(update, text.strip(), context.user_data['analysis'])
+        context.bot_data['speculative'].start(user_id, text)
         
-        await update.message.reply_text(
+        await outbound.reply(update.message,
             f"📄 Файл успешно загружен:\n"
             f"• Имя: {doc.file_name}\n"
             f"• Размер: {doc.file_size // 1024} КБ\n"
@@ -172,39 +178,108 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     except Exception as e:
         print(f"Ошибка обработки документа: {e}")
-        await update.message.reply_text(
+        await outbound.reply(update.message,
             "❌ Произошла ошибка при обработке файла.\n"
             "Попробуйте отправить его снова или обратитесь в поддержку."
         )
     finally:
         await safe_delete_file(temp_path)
 
+# Утверждений на одной странице фактчекинга
+CLAIMS_PER_PAGE = 5
+# Длинные утверждения на странице сокращаются, чтобы сообщение уложилось в лимит Telegram
+CLAIM_PREVIEW_CHARS = 600
+# Лимит текста страницы с запасом до 4096 (эмодзи в UTF-16 занимают по два символа)
+FACT_CHECK_PAGE_CHARS = 4000
+
+def escape_markdown(text: str) -> str:
+    """Экранирует символы разметки Markdown в тексте пользователя"""
+    return re.sub(r'([_*`\[])', r'\\\1', text)
+
+def claim_preview(claim: str, budget: int) -> str:
+    """Экранированное утверждение не длиннее budget символов (с «…», если сокращено)"""
+    limit = min(len(claim), CLAIM_PREVIEW_CHARS)
+    while True:
+        preview = escape_markdown(claim[:limit]) + ("…" if limit < len(claim) else "")
+        if len(preview) <= budget or limit == 0:
+            return preview
+        # Экранирование удлиняет текст: сокращаем исходник пропорционально и экранируем заново
+        limit = max(0, min(limit - 1, limit * (budget - 1) // len(preview)))
+
+def render_fact_check_page(context: ContextTypes.DEFAULT_TYPE, page: int):
+    """Текст и клавиатура страницы утверждений.
+
+    Данные кнопок короткие: fc:p:<страница>, fc:s:<номер>, fc:t:<номер>, fc:all, fc:sel.
+    """
+    claims = context.user_data.get('fact_check_claims', [])
+    selected = context.user_data.get('selected_claims', set())
+    pages = max(1, (len(claims) + CLAIMS_PER_PAGE - 1) // CLAIMS_PER_PAGE)
+    page = min(max(page, 0), pages - 1)
+    context.user_data['fact_check_page'] = page
+    
+    first = page * CLAIMS_PER_PAGE
+    indices = range(first, min(first + CLAIMS_PER_PAGE, len(claims)))
+    
+    lines = [f"🔍 *Режим фактчекинга:* утверждений: {len(claims)}"]
+    if pages > 1:
+        lines[0] += f" (страница {page + 1} из {pages})"
+    prefixes = [f"{'✅ ' if i in selected else ''}*{i + 1}.* " for i in indices]
+    # Место под утверждения делится поровну, чтобы вся страница уложилась в лимит
+    budget = (FACT_CHECK_PAGE_CHARS - len(lines[0]) - sum(len(p) + 2 for p in prefixes)) // max(1, len(prefixes))
+    for i, prefix in zip(indices, prefixes):
+        lines.append(prefix + claim_preview(claims[i], budget))
+    
+    keyboard = [
+        [
+            InlineKeyboardButton(f"📝 Упростить {i + 1}", callback_data=f"fc:s:{i}"),
+            InlineKeyboardButton(f"{'✅' if i in selected else '☑️'} Выбрать {i + 1}", callback_data=f"fc:t:{i}")
+        ]
+        for i in indices
+    ]
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️", callback_data=f"fc:p:{page - 1}"))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="fc:noop"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=f"fc:p:{page + 1}"))
+        keyboard.append(navigation)
+    keyboard.append([
+        InlineKeyboardButton("📝 Упростить все", callback_data="fc:all"),
+        InlineKeyboardButton(f"📝 Упростить выбранные ({len(selected)})", callback_data="fc:sel")
+    ])
+    keyboard.append([
+        InlineKeyboardButton("⬅️ Назад к тексту", callback_data="back_to_uploaded_text"),
+        InlineKeyboardButton("❓ Помощь", callback_data="fact_check_help")
+    ])
+    return "\n\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+async def show_fact_check_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: Optional[int] = None):
+    """Показывает страницу утверждений в том же сообщении (один вызов API)"""
+    query = update.callback_query
+    if not context.user_data.get('fact_check_claims'):
+        await safe_edit_message(query, "❌ Нет утверждений. Отправьте текст и выберите фактчекинг.")
+        return
+    if page is None:
+        page = context.user_data.get('fact_check_page', 0)
+    text, reply_markup = render_fact_check_page(context, page)
+    await safe_edit_message(query, text, reply_markup=reply_markup, parse_mode='Markdown')
+
 async def fact_checking_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
     
     text = context.user_data.get('pending_text', '').strip()
     if not text:
         await safe_edit_message(query, "❌ Нет текста для анализа. Отправьте текст или файл сначала.")
         return
     
-    # Предупреждение для длинных текстов
-    if len(text) > 8000:
-        await safe_edit_message(query, 
-            f"⚠️ Текст довольно длинный ({len(text)} символов).\n"
-            f"Выделение утверждений может занять время...\n\n"
-            f"Продолжить?"
-        )
-    
-    try:
-        sentences = sent_tokenize(text, language='russian')
-    except (LookupError, AttributeError) as e:
-        logger.warning(f"Tokenizer error: {e}")
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+    # Предложения уже выделены при получении текста
+    analysis = analysis_for(text, context.user_data.get('analysis'))
+    if analysis is None:
+        analysis = await analyze_text(context, text)
+        context.user_data['analysis'] = analysis
     
-    claims = [s.strip() for s in sentences if s.strip() and len(s) > 10]
+    claims = [text[start:end] for start, end in analysis['spans'] if end - start > 10]
     
     if not claims:
         await safe_edit_message(query, "❌ Не удалось выделить утверждения для проверки.")
@@ -212,70 +287,10 @@ async def fact_checking_mode(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Сохраняем утверждения в контекст
     context.user_data['fact_check_claims'] = claims
+    context.user_data['selected_claims'] = set()
     
-    # Ограничиваем количество отображаемых утверждений
-    MAX_CLAIMS_DISPLAY = 15
-    display_claims = claims[:MAX_CLAIMS_DISPLAY]
-    remaining = len(claims) - MAX_CLAIMS_DISPLAY
-    
-    header = "🔍 *Режим фактчекинга:*\n\n"
-    if remaining > 0:
-        header += f"Выделено утверждений: {len(claims)} (показаны первые {MAX_CLAIMS_DISPLAY}):\n\n"
-    else:
-        header += f"Выделено утверждений: {len(claims)}:\n\n"
-    
-    await query.edit_message_text(header, parse_mode='Markdown')
-    
-    # Отправляем утверждения порциями
-    batch_size = 5
-    for i in range(0, len(display_claims), batch_size):
-        batch = display_claims[i:i+batch_size]
-        
-        for j, claim in enumerate(batch, i+1):
-            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
-            
-            formatted_claim = f"_{j}._ {claim}"
-            
-            # Только кнопка "Упростить" без кнопки "Проверить"
-            keyboard = [
-                [InlineKeyboardButton("📝 Упростить", callback_data=f"simplify_claim_{j-1}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            try:
-                await query.message.reply_text(
-                    formatted_claim,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки утверждения: {e}")
-                await query.message.reply_text(formatted_claim, parse_mode='Markdown')
-        
-        if i + batch_size < len(display_claims):
-            await asyncio.sleep(1)
-    
-    if remaining > 0:
-        await query.message.reply_text(
-            f"ℹ️ Показаны первые {MAX_CLAIMS_DISPLAY} утверждений. "
-            f"Остальные {remaining} можно проверить позже."
-        )
-    
-    # Упрощенная клавиатура с кнопкой "Назад к тексту"
-    keyboard = [
-        [
-            InlineKeyboardButton("⬅️ Назад к тексту", callback_data="back_to_uploaded_text")
-        ],
-        [
-            InlineKeyboardButton("❓ Помощь", callback_data="fact_check_help")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.message.reply_text(
-        "Выберите действие:",
-        reply_markup=reply_markup
-    )
+    # Все утверждения в одном сообщении с постраничной навигацией
+    await show_fact_check_page(update, context, 0)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_typing_action(update, context)
@@ -304,14 +319,24 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(
+    await outbound.reply(update.message,
         help_text,
         parse_mode='Markdown',
         reply_markup=reply_markup
     )
 
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает счётчики производительности бота администраторам"""
+    user = update.effective_user
+    if user is None or user.id not in STATS_ADMIN_IDS:
+        logger.info(f"Метрики по запросу /stats:\n{metrics.format_report()}")
+        await outbound.reply(update.message, "⛔ Команда доступна только администраторам бота.")
+        return
+    await outbound.reply(update.message, metrics.format_report(), parse_mode='Markdown')
+
 def setup_handlers(application, models):
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
\ No newline at end of file
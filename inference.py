@@ -0,0 +1,264 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Any, Callable, List, Tuple
+
+from cancellation import CancellationToken, GenerationCancelled
+from metrics import metrics
+from scheduler import ShortestJobQueue, JOB_TEXT, JOB_SPECULATIVE, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Настройки исполнителя инференса
+INFERENCE_POOL = os.getenv("INFERENCE_POOL", "thread")  # thread | process
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "64"))
+
+# Имена моделей из реестра, которые нужны функциям utils
+SIMPLIFY_MODELS = ('simplify_tokenizer', 'simplify_model', 'device')
+TRANSLATE_MODELS = ('translator_tokenizer', 'translator_model', 'bert_tokenizer', 'bert_model', 'device')
+TRANSLATOR_MODELS = ('translator_tokenizer', 'translator_model', 'device')
+BERT_MODELS = ('bert_tokenizer', 'bert_model', 'device')
+
+# Реестр моделей процесса-воркера (только в режиме process)
+_worker_registry = None
+
+def _init_worker():
+    """Создаёт собственный реестр моделей в процессе-воркере"""
+    global _worker_registry
+    from download_model import download_and_setup_models
+    _worker_registry = asyncio.run(download_and_setup_models())['models']
+    _worker_registry.preload()
+
+def _call(fn: Callable, args: tuple, kwargs: dict, uses: Tuple[str, ...], registry=None):
+    """Берёт модели из реестра по именам и вызывает функцию инференса"""
+    registry = _worker_registry if registry is None else registry
+    kwargs = dict(kwargs)
+    with registry.use(uses) as models:
+        for name in uses:
+            kwargs.setdefault(name, models[name])
+        return fn(*args, **kwargs)
+
+class InferenceJob:
+    """Задача в очереди инференса"""
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, uses: Tuple[str, ...], kind: str,
+                 on_position: Optional[Callable[[int], Any]] = None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.uses = uses
+        self.kind = kind
+        self.tokens = estimate_tokens(args)
+        self.enqueued_at = 0.0
+        # Место в очереди (1 — следующая), 0 — задача выполняется
+        self.position: Optional[int] = None
+        self.on_position = on_position
+        self.started = False
+        loop = asyncio.get_running_loop()
+        self.future: asyncio.Future = loop.create_future()
+        # Отменённая задача сразу освобождает место в очереди
+        self.token: Optional[CancellationToken] = kwargs.get('cancel_token')
+        if self.token is not None:
+            self.token.add_callback(lambda: loop.call_soon_threadsafe(self._drop))
+        # Фоновую задачу можно прервать ради запроса пользователя, пока её результат никто не ждёт
+        self.preemptible = kind == JOB_SPECULATIVE and self.token is not None
+
+    def cancel(self):
+        """Отменяет задачу, если она ещё не начала выполняться"""
+        if not self.started and not self.future.done():
+            self.future.cancel()
+
+    def _drop(self):
+        if not self.started and not self.future.done():
+            metrics.inc("inference_dropped")
+            self.future.set_exception(GenerationCancelled())
+
+    def _set_position(self, position: int):
+        if position == self.position:
+            return
+        self.position = position
+        if self.on_position is not None:
+            try:
+                self.on_position(position)
+            except Exception as e:
+                logger.warning(f"Ошибка в обработчике места в очереди: {e}")
+
+class InferenceExecutor:
+    """Ограниченная очередь задач инференса поверх пула потоков или процессов.
+
+    Обработчики ждут результат через await, а generate() выполняется вне
+    event loop, поэтому бот продолжает отвечать другим пользователям.
+    Очередь упорядочена планировщиком: сначала короткие и интерактивные
+    задачи, долго ожидающие задачи постепенно поднимаются вверх.
+    """
+
+    # Коэффициент сглаживания задержки (экспоненциальное среднее)
+    LATENCY_ALPHA = 0.2
+
+    def __init__(self, registry, mode: str = INFERENCE_POOL,
+                 workers: int = INFERENCE_WORKERS, queue_size: int = INFERENCE_QUEUE_SIZE):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"❌ Неизвестный режим пула инференса: {mode}")
+        self.registry = registry
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._queue: Optional[ShortestJobQueue] = None
+        self._pool = None
+        self._dispatchers = []
+        self._seq = 0
+        self._running = 0
+        self._active: List[InferenceJob] = []
+        # Сглаженное время от постановки в очередь до результата (сек)
+        self.latency = 0.0
+
+    async def start(self):
+        self._queue = ShortestJobQueue(maxsize=self.queue_size)
+        if self.mode == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+            # Закреплённые модели загружаются сразу, остальные — при первом запросе
+            await asyncio.get_running_loop().run_in_executor(self._pool, self.registry.preload)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        print(f"✅ Исполнитель инференса запущен: {self.mode} × {self.workers}, очередь {self.queue_size}")
+
+    async def stop(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def depth(self) -> int:
+        """Количество задач, ожидающих в очереди"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def idle(self) -> bool:
+        """Нет ни выполняющихся, ни ожидающих задач"""
+        return self.depth == 0 and self._running == 0
+
+    def position(self, job: InferenceJob) -> Optional[int]:
+        """Место задачи в очереди (1 — следующая), 0 — выполняется, None — уже нет"""
+        if job.started:
+            return None if job.future.done() else 0
+        for i, queued in enumerate(self._queue.ranking(), 1):
+            if queued is job:
+                return i
+        return None
+
+    def _make_item(self, job: InferenceJob) -> tuple:
+        score, job.enqueued_at = self._queue.score(job.kind, job.tokens)
+        self._seq += 1
+        return (score, self._seq, job)
+
+    def _preempt(self, kind: str):
+        """Запрос пользователя прерывает выполняющиеся фоновые задачи"""
+        if kind == JOB_SPECULATIVE:
+            return
+        for job in self._active:
+            if job.preemptible and not job.token.cancelled:
+                metrics.inc("speculative_preempted")
+                job.token.cancel()
+
+    def _report_positions(self):
+        """Сообщает ожидающим задачам их новое место в очереди"""
+        for i, job in enumerate(self._queue.ranking(), 1):
+            job._set_position(i)
+        metrics.gauge("inference_queue_depth", self.depth)
+
+    async def submit(self, fn: Callable, *args, uses: Tuple[str, ...] = (), kind: str = JOB_TEXT,
+                     on_position: Optional[Callable[[int], Any]] = None, **kwargs) -> InferenceJob:
+        """Ставит вызов fn(*args, **kwargs) в очередь и возвращает задачу.
+
+        uses — имена моделей, которые подставляются в kwargs на стороне воркера.
+        kind — вид задачи для планировщика, on_position получает место в очереди.
+        """
+        if self._queue is None:
+            raise RuntimeError("❌ Исполнитель инференса не запущен")
+        job = InferenceJob(fn, args, kwargs, uses, kind, on_position)
+        await self._queue.put(self._make_item(job))
+        self._preempt(kind)
+        self._report_positions()
+        return job
+
+    def try_submit(self, fn: Callable, *args, uses: Tuple[str, ...] = (), kind: str = JOB_SPECULATIVE,
+                   on_position: Optional[Callable[[int], Any]] = None, **kwargs) -> Optional[InferenceJob]:
+        """Как submit, но без ожидания: при заполненной очереди возвращает None"""
+        if self._queue is None or self._queue.full():
+            return None
+        job = InferenceJob(fn, args, kwargs, uses, kind, on_position)
+        self._queue.put_nowait(self._make_item(job))
+        self._preempt(kind)
+        self._report_positions()
+        return job
+
+    async def run(self, fn: Callable, *args, uses: Tuple[str, ...] = (), kind: str = JOB_TEXT,
+                  on_position: Optional[Callable[[int], Any]] = None, **kwargs):
+        """Ставит вызов в очередь и ждёт результат"""
+        job = await self.submit(fn, *args, uses=uses, kind=kind, on_position=on_position, **kwargs)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+
+    def _observe_latency(self, job: InferenceJob):
+        latency = time.monotonic() - job.enqueued_at
+        self.latency += self.LATENCY_ALPHA * (latency - self.latency)
+        metrics.gauge("inference_latency", round(self.latency, 2))
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            self._report_positions()
+            try:
+                if job.future.done():
+                    continue
+                if job.token is not None and job.token.cancelled:
+                    job._drop()
+                    continue
+                job.started = True
+                job._set_position(0)
+                metrics.observe(f"inference_wait_{job.kind}", time.monotonic() - job.enqueued_at)
+                self._running += 1
+                self._active.append(job)
+                if self.mode == "process":
+                    # Токен отмены нельзя передать в другой процесс
+                    registry = None
+                    kwargs = {k: v for k, v in job.kwargs.items() if k != 'cancel_token'}
+                else:
+                    registry = self.registry
+                    kwargs = job.kwargs
+                try:
+                    result = await loop.run_in_executor(
+                        self._pool, _call, job.fn, job.args, kwargs, job.uses, registry
+                    )
+                finally:
+                    self._running -= 1
+                    self._active.remove(job)
+                    self._observe_latency(job)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except GenerationCancelled as e:
+                metrics.inc("inference_cancelled")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            except Exception as e:
+                logger.error(f"Ошибка инференса в {getattr(job.fn, '__name__', job.fn)}: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._queue.task_done()
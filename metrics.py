@@ -0,0 +1,70 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+class Metrics:
+    """Простые счётчики и замеры времени внутри процесса бота"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.rates: Dict[str, tuple] = {}
+
+    def inc(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Добавляет замер (например, длительность в секундах)"""
+        with self._lock:
+            stat = self.timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            stat["count"] += 1
+            stat["total"] += value
+            stat["max"] = max(stat["max"], value)
+
+    def register_rate(self, label: str, part: str, *rest: str):
+        """Регистрирует долю (в процентах), которую показывает отчёт /stats"""
+        self.rates[label] = (part, *rest)
+
+    def ratio(self, part: str, *rest: str) -> float:
+        """Доля счётчика part среди part + rest, в процентах"""
+        total = self.counters.get(part, 0) + sum(self.counters.get(name, 0) for name in rest)
+        return round(self.counters.get(part, 0) / total * 100, 1) if total else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": {name: dict(stat) for name, stat in self.timings.items()}
+            }
+
+    def format_report(self) -> str:
+        data = self.snapshot()
+        lines = ["📈 *Метрики бота:*"]
+        if data["counters"]:
+            lines.append("\n*Счётчики:*")
+            lines.extend(f"• `{name}`: {value}" for name, value in sorted(data["counters"].items()))
+        if self.rates:
+            lines.append("\n*Доли:*")
+            lines.extend(f"• {label}: {self.ratio(*names)}%" for label, names in sorted(self.rates.items()))
+        if data["gauges"]:
+            lines.append("\n*Текущие значения:*")
+            lines.extend(f"• `{name}`: {value:g}" for name, value in sorted(data["gauges"].items()))
+        if data["timings"]:
+            lines.append("\n*Время (сек):*")
+            for name, stat in sorted(data["timings"].items()):
+                avg = stat["total"] / stat["count"] if stat["count"] else 0
+                lines.append(f"• `{name}`: ср. {avg:.2f}, макс. {stat['max']:.2f}, n={stat['count']}")
+        if len(lines) == 1:
+            lines.append("Пока нет данных.")
+        return "\n".join(lines)
+
+# Общий экземпляр для всех модулей
+metrics = Metrics()
@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from telegram.error import BadRequest, RetryAfter
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: около 30 сообщений в секунду всего, 1 в секунду в один чат, 20 в минуту в группу
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", "20")) / 60
+# Сколько раз повторять вызов после RetryAfter
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst подряд"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def block(self, seconds: float):
+        """Flood control: ни одного вызова раньше чем через seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _Call:
+    """Вызов Bot API в очереди чата; одинаковые подряд идущие правки сливаются в один"""
+
+    def __init__(self, factory: Callable[[], Awaitable[Any]], merge_key: Optional[Hashable]):
+        self.factory = factory
+        self.merge_key = merge_key
+        self.futures: List[asyncio.Future] = []
+        self.enqueued_at = time.monotonic()
+        # Запрос уже ушёл в Telegram — подменять его нельзя
+        self.sending = False
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+class OutboundScheduler:
+    """Единая очередь исходящих вызовов Bot API.
+
+    Вызовы одного чата выполняются по порядку с учётом лимита чата и общего лимита бота.
+    RetryAfter приостанавливает чат ровно на указанное время и повторяет тот же вызов,
+    а не отправляет сообщение заново другим способом. Правка сообщения, которая ещё
+    ждёт в очереди, заменяется более новой правкой того же сообщения.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST, group_rate: float = OUTBOUND_GROUP_RATE):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[_Call]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id — группы и каналы, у них лимит строже
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    async def call(self, chat_id: int, factory: Callable[[], Awaitable[Any]],
+                   merge_key: Optional[Hashable] = None) -> Any:
+        """Ставит вызов factory() в очередь чата и возвращает его результат"""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(chat_id, deque())
+        last = queue[-1] if queue else None
+        if merge_key is not None and last is not None and last.merge_key == merge_key and not last.sending:
+            # Предыдущая правка ещё не отправлена — отправим сразу последнюю
+            last.factory = factory
+            last.futures.append(future)
+            metrics.inc("outbound_merged")
+        else:
+            item = _Call(factory, merge_key)
+            item.futures.append(future)
+            queue.append(item)
+        metrics.gauge("outbound_queue_depth", self.depth)
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run(chat_id))
+        return await future
+
+    async def _run(self, chat_id: int):
+        queue = self._queues[chat_id]
+        bucket = self._bucket(chat_id)
+        try:
+            while queue:
+                item = queue[0]
+                try:
+                    result = await self._execute(bucket, item)
+                except Exception as e:
+                    queue.popleft()
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    queue.popleft()
+                    for future in item.futures:
+                        if not future.done():
+                            future.set_result(result)
+                metrics.gauge("outbound_queue_depth", self.depth)
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    async def _execute(self, bucket: TokenBucket, item: _Call) -> Any:
+        for attempt in range(OUTBOUND_MAX_RETRIES + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            item.sending = True
+            try:
+                result = await item.factory()
+            except RetryAfter as e:
+                if attempt == OUTBOUND_MAX_RETRIES:
+                    raise
+                delay = _retry_after_seconds(e)
+                metrics.inc("outbound_retry_after")
+                logger.warning(f"Flood control: пауза {delay:g} с перед повтором")
+                bucket.block(delay)
+                continue
+            except BadRequest as e:
+                # Тот же текст и та же клавиатура — правка не нужна, это не ошибка
+                if "not modified" not in str(e).lower():
+                    raise
+                result = None
+            finally:
+                item.sending = False
+            metrics.observe("outbound_latency", time.monotonic() - item.enqueued_at)
+            return result
+
+    # --- Обёртки для частых вызовов ---
+    async def reply(self, message, text: str, **kwargs):
+        return await self.call(message.chat_id, lambda: message.reply_text(text, **kwargs))
+
+    async def document(self, message, data: bytes, filename: str, **kwargs):
+        return await self.call(
+            message.chat_id, lambda: message.reply_document(document=data, filename=filename, **kwargs)
+        )
+
+    async def edit(self, query, text: str, **kwargs):
+        message = query.message
+        chat_id = message.chat_id if message is not None else 0
+        key = ("edit", message.message_id if message is not None else query.inline_message_id)
+        return await self.call(chat_id, lambda: query.edit_message_text(text, **kwargs), merge_key=key)
+
+    async def edit_reply_markup(self, query, reply_markup=None):
+        message = query.message
+        chat_id = message.chat_id if message is not None else 0
+        return await self.call(chat_id, lambda: query.edit_message_reply_markup(reply_markup=reply_markup))
+
+    async def chat_action(self, bot, chat_id: int, action: str):
+        return await self.call(
+            chat_id, lambda: bot.send_chat_action(chat_id=chat_id, action=action), merge_key=("action", action)
+        )
+
+# Общий планировщик исходящих сообщений бота
+outbound = OutboundScheduler()
@@ -0,0 +1,343 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional
+
+from utils import (
+    TRANSLATE_SHORT_TEXT, fits_single_chunk, simplify_long_text, simplify_document, simplify_parts, translate_text, translate_batch,
+    postedit_translation, detect_language, split_translation_sentences,
+    get_simplify_cache_params
+)
+from inference import SIMPLIFY_MODELS, TRANSLATOR_MODELS, BERT_MODELS, InferenceJob
+from postedit import get_postedit_engine
+from analysis import analysis_for
+from scheduler import JOB_CLAIM, JOB_TEXT, JOB_TRANSLATE, JOB_POSTEDIT, JOB_SPECULATIVE
+from cache import make_cache_key
+from coalescing import SingleFlight
+from metrics import metrics
+from progress import ProgressReporter, SIMPLIFY_STREAM_TOKENS
+from cancellation import CancellationToken, GenerationCancelled
+from profiles import PROFILE_QUALITY, PROFILE_FAST, get_profile_params, profiles_at_least
+
+logger = logging.getLogger(__name__)
+
+# Одинаковые запросы, пришедшие одновременно, выполняются один раз
+_simplify_flights = SingleFlight("simplify")
+_translate_flights = SingleFlight("translate")
+
+# Фоновые (спекулятивные) задачи упрощения по ключу кэша
+_speculative_jobs: Dict[str, InferenceJob] = {}
+
+def choose_profile(bot_data: Dict[str, Any], model: str) -> str:
+    """Профиль генерации по текущей нагрузке (quality, если контроллер не настроен)"""
+    controller = bot_data.get('profiles')
+    return controller.choose(model) if controller is not None else PROFILE_QUALITY
+
+def simplify_cache_key(bot_data: Dict[str, Any], text: str, strength: str, profile: str = PROFILE_QUALITY) -> str:
+    return make_cache_key(
+        text, f"simplify_{strength}", get_simplify_cache_params(strength, profile), bot_data.get('simplify_revision', '')
+    )
+
+def simplify_cache_keys(bot_data: Dict[str, Any], text: str, strength: str, profile: str) -> List[str]:
+    """Ключи результатов не хуже profile: при нагрузке подходит и более качественный готовый результат"""
+    return [simplify_cache_key(bot_data, text, strength, p) for p in profiles_at_least(profile)]
+
+def translation_memory_keys(text: str, profile: str, revision: str) -> List[str]:
+    """Ключи памяти переводов; первый — для профиля quality, последний — для profile"""
+    return [
+        make_cache_key(text, "translate", {"profile": p, **get_profile_params("translate", p)}, revision)
+        for p in profiles_at_least(profile)
+    ]
+
+async def simplify(bot_data: Dict[str, Any], text: str, strength: str = "medium",
+                   progress: Optional[ProgressReporter] = None,
+                   cancel_token: Optional[CancellationToken] = None,
+                   session: Optional[Dict[str, Any]] = None,
+                   analysis: Optional[Dict[str, Any]] = None) -> str:
+    """Упрощает текст: сначала кэш, затем микро-батчер или исполнитель инференса.
+
+    progress получает реальный прогресс: место в очереди, готовые части длинного текста или токены.
+    При отмене cancel_token выбрасывается GenerationCancelled.
+    session — словарь пользователя, где хранятся части последнего длинного текста по уровням:
+    в исправленной версии заново упрощаются только части с изменёнными предложениями.
+    analysis — разбор текста при получении (analysis.TextAnalyzer), чтобы не сегментировать его снова.
+    """
+    cache = bot_data.get('result_cache')
+    profile = choose_profile(bot_data, "simplify")
+    if cache is not None:
+        cached = cache.get_any(simplify_cache_keys(bot_data, text, strength, profile))
+        if cached is not None:
+            return cached
+
+    analysis = analysis_for(text, analysis)
+    # Потоковый вывод несовместим с beam search: такой результат получен жадным поиском
+    # и кэшируется под ключом быстрого профиля, чтобы не выдавать его за результат с лучами
+    streamed = (progress is not None and SIMPLIFY_STREAM_TOKENS and bot_data['inference'].mode == "thread"
+                and fits_single_chunk(text, strength, analysis))
+    if streamed:
+        profile = PROFILE_FAST
+    key = simplify_cache_key(bot_data, text, strength, profile)
+
+    return await _simplify_flights.do(
+        key,
+        lambda token: _simplify_uncached(
+            bot_data, text, strength, profile, key, token, progress, session, analysis, streamed
+        ),
+        cancel_token
+    )
+
+async def _simplify_uncached(bot_data: Dict[str, Any], text: str, strength: str, profile: str, key: str,
+                             cancel_token: CancellationToken,
+                             progress: Optional[ProgressReporter] = None,
+                             session: Optional[Dict[str, Any]] = None,
+                             analysis: Optional[Dict[str, Any]] = None,
+                             streamed: bool = False) -> str:
+    # Фоновое вычисление уже идёт — дожидаемся его; ещё не началось или уже прервано —
+    # отменяем и считаем сами
+    job = _speculative_jobs.get(key)
+    if job is not None:
+        if job.started and not job.token.cancelled:
+            metrics.inc("speculative_joined")
+            # Результат теперь нужен пользователю — прерывать задачу ради других запросов нельзя
+            job.preemptible = False
+            try:
+                return await asyncio.shield(job.future)
+            except GenerationCancelled:
+                # Задачу успели прервать до того, как она стала непрерываемой
+                logger.info("Фоновое упрощение прервано, считаем заново")
+        else:
+            job.cancel()
+
+    # Место в очереди сообщается в event loop, а колбэки генерации нельзя передать в другой процесс
+    on_position = progress.on_queue if progress is not None else None
+    if bot_data['inference'].mode != "thread":
+        progress = None
+
+    if fits_single_chunk(text, strength, analysis) and not streamed:
+        # Тексты из одной части объединяются в общие партии с запросами других пользователей
+        result = await bot_data['simplify_batcher'].simplify(
+            text, strength=strength, profile=profile, cancel_token=cancel_token
+        )
+    elif session is not None and not fits_single_chunk(text, strength, analysis):
+        # Части прежней версии текста с тем же уровнем и той же моделью используются повторно
+        previous = session.get(strength)
+        if previous is not None and previous.get('revision') != bot_data.get('simplify_revision', ''):
+            previous = None
+        state = await bot_data['inference'].run(
+            simplify_document,
+            text,
+            strength=strength,
+            previous=previous,
+            analysis=analysis,
+            profile=profile,
+            cancel_token=cancel_token,
+            uses=SIMPLIFY_MODELS,
+            kind=JOB_TEXT,
+            on_position=on_position,
+            progress_callback=progress.on_parts if progress is not None else None
+        )
+        state['revision'] = bot_data.get('simplify_revision', '')
+        session[strength] = state
+        result = state['result']
+    else:
+        callbacks = {}
+        if progress is not None:
+            callbacks = {'progress_callback': progress.on_parts, 'stream_callback': progress.on_tokens}
+        result = await bot_data['inference'].run(
+            simplify_long_text,
+            text,
+            strength=strength,
+            analysis=analysis,
+            profile=profile,
+            cancel_token=cancel_token,
+            uses=SIMPLIFY_MODELS,
+            kind=JOB_TEXT,
+            on_position=on_position,
+            **callbacks
+        )
+
+    logger.info(f"Упрощение ({strength}) выполнено с профилем {profile}")
+    cache = bot_data.get('result_cache')
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+async def simplify_many(bot_data: Dict[str, Any], texts: List[str], strength: str = "medium",
+                        cancel_token: Optional[CancellationToken] = None) -> List[str]:
+    """Упрощает несколько коротких текстов (утверждений) одной задачей инференса.
+
+    Готовые результаты берутся из кэша, остальные упрощаются пакетно и кэшируются
+    по отдельности, так что упрощение одного утверждения потом отдаётся из кэша.
+    """
+    cache = bot_data.get('result_cache')
+    profile = choose_profile(bot_data, "simplify")
+    results: List[Optional[str]] = [None] * len(texts)
+    batch = []
+    for i, text in enumerate(texts):
+        if cache is not None:
+            results[i] = cache.get_any(simplify_cache_keys(bot_data, text, strength, profile))
+        if results[i] is None and fits_single_chunk(text, strength):
+            batch.append(i)
+
+    if batch:
+        unique = list(dict.fromkeys(texts[i] for i in batch))
+        simplified = await bot_data['inference'].run(
+            simplify_parts,
+            unique,
+            strength=strength,
+            profile=profile,
+            cancel_token=cancel_token,
+            uses=SIMPLIFY_MODELS,
+            kind=JOB_CLAIM
+        )
+        done = dict(zip(unique, simplified))
+        for text, result in done.items():
+            if cache is not None:
+                cache.put(simplify_cache_key(bot_data, text, strength, profile), result)
+        for i in batch:
+            results[i] = done[texts[i]]
+        metrics.inc("simplify_bulk_generated", len(unique))
+
+    # Длинные утверждения упрощаются по частям, как обычный текст
+    rest = [i for i, result in enumerate(results) if result is None]
+    if rest:
+        simplified = await asyncio.gather(
+            *(simplify(bot_data, texts[i], strength=strength, cancel_token=cancel_token) for i in rest)
+        )
+        for i, result in zip(rest, simplified):
+            results[i] = result
+    metrics.inc("simplify_bulk_cached", len(texts) - len(batch) - len(rest))
+    return results
+
+async def precompute_simplify(bot_data: Dict[str, Any], text: str, strength: str = "medium",
+                              cancel_token: Optional[CancellationToken] = None) -> bool:
+    """Фоновое упрощение с низким приоритетом; результат только сохраняется в кэш.
+
+    Возвращает False, если задача не понадобилась, очередь занята или задача отменена.
+    Токен отменяется при новом тексте пользователя и при появлении запроса в очереди.
+    """
+    if cancel_token is None:
+        cancel_token = CancellationToken()
+    cache = bot_data.get('result_cache')
+    if cache is None:
+        return False
+    profile = choose_profile(bot_data, "simplify")
+    key = simplify_cache_key(bot_data, text, strength, profile)
+    if key in _speculative_jobs:
+        return False
+    if cache.get_any(simplify_cache_keys(bot_data, text, strength, profile), record=False) is not None:
+        return False
+
+    job = bot_data['inference'].try_submit(
+        simplify_long_text,
+        text,
+        strength=strength,
+        profile=profile,
+        cancel_token=cancel_token,
+        uses=SIMPLIFY_MODELS,
+        kind=JOB_SPECULATIVE
+    )
+    if job is None:
+        return False
+    metrics.inc("speculative_started")
+    _speculative_jobs[key] = job
+
+    def on_done(future: asyncio.Future):
+        _speculative_jobs.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            cache.put(key, future.result())
+
+    job.future.add_done_callback(on_done)
+    try:
+        await asyncio.shield(job.future)
+    except asyncio.CancelledError:
+        # Задача из очереди снимается сразу, начатая генерация останавливается между шагами.
+        # Если к ней уже присоединился запрос пользователя, она доработает для него
+        if job.preemptible:
+            metrics.inc("speculative_cancelled")
+            cancel_token.cancel()
+        raise
+    except GenerationCancelled:
+        return False
+    return True
+
+async def translate(bot_data: Dict[str, Any], text: str,
+                    progress: Optional[ProgressReporter] = None,
+                    cancel_token: Optional[CancellationToken] = None,
+                    lang: Optional[str] = None) -> str:
+    """Переводит текст на английский; одинаковые одновременные запросы выполняются один раз.
+
+    lang — язык из разбора исходного текста, иначе определяется заново.
+    """
+    key = make_cache_key(text, "translate", {}, bot_data.get('translator_revision', ''))
+    return await _translate_flights.do(
+        key,
+        lambda token: _translate_uncached(bot_data, text, token, progress, lang),
+        cancel_token
+    )
+
+async def _translate_uncached(bot_data: Dict[str, Any], text: str, cancel_token: CancellationToken,
+                              progress: Optional[ProgressReporter] = None, lang: Optional[str] = None) -> str:
+    """Уже переведённые куски берутся из памяти переводов"""
+    on_position = progress.on_queue if progress is not None else None
+    profile = choose_profile(bot_data, "translate")
+    # BERT загружается, только если включены правила пост-редактирования с эмбеддингами
+    needs_bert = get_postedit_engine().needs_embeddings
+    memory = bot_data.get('translation_memory')
+    if memory is None:
+        return await bot_data['inference'].run(
+            translate_text,
+            text,
+            profile=profile,
+            cancel_token=cancel_token,
+            lang=lang,
+            uses=TRANSLATOR_MODELS + (BERT_MODELS if needs_bert else ()),
+            kind=JOB_TRANSLATE,
+            on_position=on_position
+        )
+    if not text.strip():
+        return ""
+
+    revision = bot_data.get('translator_revision', '')
+    sentences = split_translation_sentences(text, lang or detect_language(text))
+
+    # Единица памяти — предложение: поиск и запись идут по одному и тому же ключу,
+    # поэтому правка одного предложения или повтор из другого текста не переводятся заново
+    pieces = []  # готовый перевод (str) или индекс в missing
+    missing = []
+    missing_index: Dict[str, int] = {}
+    for sent in sentences:
+        cached = memory.get_any(translation_memory_keys(sent, profile, revision))
+        if cached is not None:
+            pieces.append(cached)
+            continue
+        if sent not in missing_index:
+            missing_index[sent] = len(missing)
+            missing.append(sent)
+        pieces.append(missing_index[sent])
+
+    if missing:
+        # Пропущенные предложения переводятся отдельными элементами общей партии
+        translated = await bot_data['inference'].run(
+            translate_batch,
+            missing,
+            profile=profile,
+            cancel_token=cancel_token,
+            uses=TRANSLATOR_MODELS,
+            kind=JOB_TRANSLATE,
+            on_position=on_position
+        )
+        for sent, result in zip(missing, translated):
+            memory.put(translation_memory_keys(sent, profile, revision)[-1], result)
+        pieces = [translated[piece] if isinstance(piece, int) else piece for piece in pieces]
+
+    whole_text = len(text) >= TRANSLATE_SHORT_TEXT
+    if not needs_bert:
+        # Правила без эмбеддингов — один проход регулярного выражения, исполнитель не нужен
+        return postedit_translation(pieces, whole_text=whole_text)
+    return await bot_data['inference'].run(
+        postedit_translation,
+        pieces,
+        whole_text=whole_text,
+        uses=BERT_MODELS,
+        kind=JOB_POSTEDIT
+    )
@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Файл с правилами пост-редактирования перевода
+POSTEDIT_RULES_PATH = os.getenv(
+    "POSTEDIT_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "postedit_rules.json")
+)
+
+# Эмбеддинги списка текстов: тензор (n, d) с нормированными строками
+Embedder = Callable[[List[str]], Any]
+
+# Очистка после замен: запятые и пробелы в начале, в конце, повторяющиеся
+_CLEANUP = re.compile(r"(?P<lead>^[\s,]+)|(?P<trail>\s+$)|(?P<commas>\s*,(?:\s*,)*)|(?P<space>\s+)")
+_CLEANUP_REPLACEMENTS = {"lead": "", "trail": "", "commas": ",", "space": " "}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _dedupe_sentences(text: str, embed: Embedder, threshold: float = 0.95) -> str:
+    """Убирает подряд идущие почти одинаковые предложения (частая ошибка перевода)"""
+    sentences = [s for s in _SENTENCE_END.split(text) if s.strip()]
+    if len(sentences) < 2:
+        return text
+    embeddings = embed(sentences)
+    kept = [sentences[0]]
+    last = embeddings[0]
+    for sentence, embedding in zip(sentences[1:], embeddings[1:]):
+        if float((last * embedding).sum()) < threshold:
+            kept.append(sentence)
+        last = embedding
+    return " ".join(kept)
+
+# Правила, которым нужны эмбеддинги BERT
+EMBEDDING_RULES: Dict[str, Callable[..., str]] = {
+    "dedupe_sentences": _dedupe_sentences,
+}
+
+class PostEditEngine:
+    """Пост-редактирование перевода по правилам из файла.
+
+    Все замены собираются в одно регулярное выражение и применяются за один
+    проход, затем один проход очистки. BERT нужен только правилам из "embedding".
+    """
+
+    def __init__(self, rules: Dict[str, List[Dict[str, Any]]]):
+        self.replace_rules = rules.get("replace", [])
+        self.embedding_rules = rules.get("embedding", [])
+        for rule in self.embedding_rules:
+            if rule.get("type") not in EMBEDDING_RULES:
+                raise ValueError(f"❌ Неизвестное правило пост-редактирования: {rule.get('type')}")
+
+        alternatives = []
+        for i, rule in enumerate(self.replace_rules):
+            pattern = rule["pattern"] if rule.get("regex") else re.escape(rule["pattern"])
+            # Группы внутри правил не должны сбивать нумерацию: ищем правило по имени группы
+            alternatives.append(rf"(?P<r{i}>\b(?:{pattern})\b)")
+        self.pattern = re.compile("|".join(alternatives), re.IGNORECASE) if alternatives else None
+
+    @classmethod
+    def from_file(cls, path: str = POSTEDIT_RULES_PATH) -> "PostEditEngine":
+        with open(path, encoding="utf-8") as f:
+            engine = cls(json.load(f))
+        print(f"✅ Правила пост-редактирования загружены: {len(engine.replace_rules)} замен, "
+              f"{len(engine.embedding_rules)} с эмбеддингами")
+        return engine
+
+    @property
+    def needs_embeddings(self) -> bool:
+        return bool(self.embedding_rules)
+
+    def _replace(self, match: re.Match) -> str:
+        return self.replace_rules[int(match.lastgroup[1:])]["replacement"]
+
+    def apply(self, text: str) -> str:
+        """Замены и очистка одного фрагмента"""
+        if self.pattern is not None:
+            text = self.pattern.sub(self._replace, text)
+        text = _CLEANUP.sub(lambda m: _CLEANUP_REPLACEMENTS[m.lastgroup], text)
+
+        # Если после очистки предложение начинается с маленькой буквы, исправляем
+        if text and text[0].islower():
+            text = text[0].upper() + text[1:]
+        return text
+
+    def apply_embedding_rules(self, text: str, embed: Embedder) -> str:
+        """Правила с эмбеддингами для всего текста"""
+        for rule in self.embedding_rules:
+            params = {key: value for key, value in rule.items() if key != "type"}
+            text = EMBEDDING_RULES[rule["type"]](text, embed, **params)
+        return text
+
+def make_bert_embedder(bert_tokenizer, bert_model, device) -> Embedder:
+    """Средние по токенам эмбеддинги BERT, нормированные для косинусной близости"""
+    import torch
+
+    def embed(texts: List[str]):
+        inputs = bert_tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device)
+        with torch.no_grad():
+            hidden = bert_model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return torch.nn.functional.normalize(pooled, dim=-1)
+
+    return embed
+
+_engine: Optional[PostEditEngine] = None
+
+def get_postedit_engine() -> PostEditEngine:
+    """Общий движок, правила читаются из файла один раз"""
+    global _engine
+    if _engine is None:
+        _engine = PostEditEngine.from_file()
+    return _engine
+
+# Типичные фрагменты перевода для бенчмарка (часть с ошибками, которые исправляют правила)
+BENCHMARK_CHUNKS = [
+    "The patches are applied to the skin , and they contain anthioxidant substances.",
+    "They have aesthetic design and can be used at any time of the day.",
+    "Climate change is a long-term change in the average weather conditions on Earth.",
+    "The central bank raised the key rate to curb the growth of consumer prices.",
+    "Photosynthesis is the process by which plants convert light energy into chemical energy.",
+    "The tables release anion , , which reinforces human immunity.",
+]
+
+def _legacy_postedit(text: str, rules: List[Dict[str, Any]]) -> str:
+    """Прежняя схема: отдельный re.sub на каждое правило и каждую очистку"""
+    for rule in rules:
+        pattern = rule["pattern"] if rule.get("regex") else re.escape(rule["pattern"])
+        text = re.sub(rf"\b{pattern}\b", rule["replacement"], text, flags=re.IGNORECASE)
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(r"\s+,", ",", text)
+    text = re.sub(r",\s*,", ",", text)
+    text = re.sub(r"^\s*,\s*", "", text)
+    if text and text[0].islower():
+        text = text[0].upper() + text[1:]
+    return text
+
+def benchmark(repeats: int = 2000, with_bert: bool = False) -> Dict[str, float]:
+    """Среднее время пост-обработки одного чанка (мс) до и после"""
+    engine = get_postedit_engine()
+    forward = None
+    if with_bert:
+        # Прежняя версия делала прямой проход BERT для каждого чанка и отбрасывала результат
+        from transformers import BertTokenizer, BertModel
+        tokenizer = BertTokenizer.from_pretrained("bert-base-multilingual-cased")
+        model = BertModel.from_pretrained("bert-base-multilingual-cased")
+        embed = make_bert_embedder(tokenizer, model, "cpu")
+        forward = lambda text: embed([text])
+
+    def measure(fn, count):
+        start = time.perf_counter()
+        for _ in range(count):
+            for chunk in BENCHMARK_CHUNKS:
+                fn(chunk)
+        return (time.perf_counter() - start) / count / len(BENCHMARK_CHUNKS) * 1000
+
+    before = measure(lambda chunk: _legacy_postedit(chunk, engine.replace_rules), repeats)
+    after = measure(engine.apply, repeats)
+    report = {"legacy_regex_ms": before, "engine_ms": after}
+    print(f"📊 Прежние re.sub: {before:.4f} мс/чанк, один проход: {after:.4f} мс/чанк")
+    if forward is not None:
+        bert_ms = measure(forward, max(1, repeats // 200))
+        report["legacy_bert_ms"] = bert_ms
+        print(f"📊 Прежний прямой проход BERT: {bert_ms:.2f} мс/чанк (теперь не выполняется)")
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк пост-редактирования перевода")
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--with-bert", action="store_true", help="измерить и прежний прямой проход BERT")
+    args = parser.parse_args(argv)
+    benchmark(args.repeats, args.with_bert)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
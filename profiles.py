@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Профили генерации — от лучшего качества к самому быстрому
+PROFILE_QUALITY = "quality"
+PROFILE_BALANCED = "balanced"
+PROFILE_FAST = "fast"
+PROFILES = (PROFILE_QUALITY, PROFILE_BALANCED, PROFILE_FAST)
+
+# Параметры generate, которые меняет профиль (для каждой модели и уровня упрощения)
+GENERATION_PROFILES: Dict[str, Dict[str, Any]] = {
+    "simplify": {
+        "medium": {
+            PROFILE_QUALITY: {"num_beams": 4},
+            PROFILE_BALANCED: {"num_beams": 2},
+            PROFILE_FAST: {"num_beams": 1, "do_sample": False},
+        },
+        "strong": {
+            PROFILE_QUALITY: {"num_beams": 4},
+            PROFILE_BALANCED: {"num_beams": 2},
+            PROFILE_FAST: {"num_beams": 1, "do_sample": False},
+        },
+    },
+    "translate": {
+        PROFILE_QUALITY: {"num_beams": 5},
+        PROFILE_BALANCED: {"num_beams": 3},
+        PROFILE_FAST: {"num_beams": 1},
+    },
+}
+
+# Настройки выбора профиля по нагрузке
+GENERATION_PROFILE = os.getenv("GENERATION_PROFILE", "")  # пусто — автоматически, иначе фиксированный профиль
+GENERATION_LATENCY_SLO = float(os.getenv("GENERATION_LATENCY_SLO", "20"))  # секунды от постановки в очередь до результата
+PROFILE_DEGRADE_DEPTH = int(os.getenv("PROFILE_DEGRADE_DEPTH", "4"))  # задач в очереди на один воркер
+PROFILE_RECOVER_SECONDS = float(os.getenv("PROFILE_RECOVER_SECONDS", "30"))
+
+def get_profile_params(model: str, profile: str, strength: Optional[str] = None) -> Dict[str, Any]:
+    """Параметры generate профиля; неизвестный профиль считается quality"""
+    profiles = GENERATION_PROFILES[model]
+    if strength is not None:
+        profiles = profiles.get(strength, profiles["medium"])
+    return dict(profiles.get(profile, profiles[PROFILE_QUALITY]))
+
+def profiles_at_least(profile: str) -> Tuple[str, ...]:
+    """Профили не хуже заданного, начиная с лучшего (результаты любого из них можно отдать из кэша)"""
+    if profile not in PROFILES:
+        return (PROFILE_QUALITY,)
+    return PROFILES[:PROFILES.index(profile) + 1]
+
+class ProfileController:
+    """Выбирает профиль генерации по глубине очереди и задержке инференса.
+
+    При перегрузке профиль становится быстрее (при очень глубокой очереди —
+    сразу самым быстрым), а обратно повышается по одной ступени, когда
+    нагрузка спала и прошло PROFILE_RECOVER_SECONDS.
+    """
+
+    # Минимальный интервал между понижениями на одну ступень (сек)
+    DEGRADE_INTERVAL = 5.0
+
+    def __init__(self, executor, slo: float = GENERATION_LATENCY_SLO,
+                 degrade_depth: int = PROFILE_DEGRADE_DEPTH,
+                 recover_seconds: float = PROFILE_RECOVER_SECONDS,
+                 fixed: str = GENERATION_PROFILE):
+        if fixed and fixed not in PROFILES:
+            raise ValueError(f"❌ Неизвестный профиль генерации: {fixed}")
+        self.executor = executor
+        self.slo = slo
+        self.degrade_depth = max(1, degrade_depth)
+        self.recover_seconds = recover_seconds
+        self.fixed = fixed
+        self._level = PROFILES.index(fixed) if fixed else 0
+        self._changed_at = time.monotonic()
+        metrics.gauge("generation_profile_level", self._level)
+
+    @property
+    def profile(self) -> str:
+        return PROFILES[self._level]
+
+    def choose(self, model: str) -> str:
+        """Профиль для нового запроса к модели model"""
+        if not self.fixed:
+            self._adjust()
+        metrics.inc(f"profile_{model}_{self.profile}")
+        return self.profile
+
+    def _adjust(self):
+        now = time.monotonic()
+        depth = self.executor.depth / self.executor.workers
+        # Без задач старая оценка задержки уже ничего не говорит о нагрузке
+        latency = 0.0 if self.executor.idle else self.executor.latency
+
+        if depth >= 2 * self.degrade_depth:
+            target = len(PROFILES) - 1
+        elif (depth >= self.degrade_depth or latency > self.slo) and now - self._changed_at >= self.DEGRADE_INTERVAL:
+            target = min(self._level + 1, len(PROFILES) - 1)
+        else:
+            target = self._level
+
+        if target > self._level:
+            self._set_level(target, now, f"очередь {depth:g}, задержка {latency:.1f} с")
+            return
+
+        relaxed = self.executor.idle or (depth < self.degrade_depth / 2 and latency < self.slo / 2)
+        if self._level and relaxed and now - self._changed_at >= self.recover_seconds:
+            self._set_level(self._level - 1, now, "нагрузка снизилась")
+
+    def _set_level(self, level: int, now: float, reason: str):
+        previous = self.profile
+        self._level = level
+        self._changed_at = now
+        metrics.inc("profile_changes")
+        metrics.gauge("generation_profile_level", level)
+        print(f"⚙️ Профиль генерации: {previous} → {self.profile} ({reason})")
+        logger.info(f"Generation profile {previous} -> {self.profile}: {reason}")
@@ -0,0 +1,93 @@
+import os
+import time
+import asyncio
+import logging
+from typing import List, Optional
+
+from outbound import outbound
+
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между редактированиями сообщения с прогрессом (сек)
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "1.5"))
+# Потоковый вывод токенов для коротких текстов (генерация без beam search)
+SIMPLIFY_STREAM_TOKENS = os.getenv("SIMPLIFY_STREAM_TOKENS", "0") == "1"
+
+MAX_MESSAGE_LENGTH = 4096
+
+class ProgressReporter:
+    """Показывает реальный прогресс генерации, редактируя одно сообщение не чаще интервала.
+
+    Методы on_parts / on_tokens можно вызывать из потока инференса.
+    """
+
+    def __init__(self, query, header: str, min_interval: float = PROGRESS_EDIT_INTERVAL):
+        self.query = query
+        self.header = header
+        self.min_interval = min_interval
+        self._loop = asyncio.get_running_loop()
+        self._status = ""
+        self._partial = ""
+        self._last_text = ""
+        self._last_edit = 0.0
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def on_parts(self, done: int, total: int, results: List[Optional[str]]):
+        """Завершена очередная партия частей длинного текста"""
+        partial = " … ".join(r for r in results if r)
+        self._loop.call_soon_threadsafe(
+            self._update, f"Готово частей: {done}/{total} ({done / total * 100:.0f}%)", partial
+        )
+
+    def on_queue(self, position: int):
+        """Изменилось место задачи в очереди инференса (0 — задача начала выполняться)"""
+        if position:
+            self._loop.call_soon_threadsafe(self._update, f"⏳ Место в очереди: {position}", self._partial)
+        else:
+            self._loop.call_soon_threadsafe(self._update, "⚙️ Обрабатываю...", self._partial)
+
+    def on_tokens(self, text: str):
+        """Новый фрагмент потоковой генерации"""
+        self._loop.call_soon_threadsafe(self._update, "✍️ Пишу...", text)
+
+    def _update(self, status: str, partial: str):
+        if self._closed:
+            return
+        self._status = status
+        self._partial = partial
+        if self._pending is not None:
+            return
+        delay = max(0.0, self._last_edit + self.min_interval - time.monotonic())
+        self._pending = self._loop.call_later(delay, self._flush)
+
+    def _flush(self):
+        self._pending = None
+        if self._closed:
+            return
+        self._last_edit = time.monotonic()
+        self._task = asyncio.create_task(self._edit())
+
+    async def _edit(self):
+        text = f"{self.header}\n\n{self._status}"
+        if self._partial:
+            text += f"\n\n{self._partial}"
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH - 1] + "…"
+        if text == self._last_text or self._closed:
+            return
+        self._last_text = text
+        try:
+            await outbound.edit(self.query, text)
+        except Exception as e:
+            logger.warning(f"Error updating progress: {e}")
+
+    async def close(self):
+        """Останавливает обновления перед показом итогового результата"""
+        self._closed = True
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._task is not None and not self._task.done():
+            await self._task
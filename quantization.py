@@ -0,0 +1,166 @@
+import os
+import gc
+import sys
+import time
+import logging
+import argparse
+from shutil import rmtree
+from typing import Dict, List, Optional
+
+import torch
+import transformers
+from transformers import AutoModelForSeq2SeqLM
+
+from backends import REVISION_FILE, PARITY_TEXTS, converted_model_dir
+from registry import current_rss_mb
+
+logger = logging.getLogger(__name__)
+
+# Режимы квантизации моделей упрощения и перевода при работе на CPU
+QUANTIZATION_NONE = "none"
+QUANTIZATION_INT8 = "int8"  # динамическая INT8-квантизация слоёв Linear
+QUANTIZATION_BF16 = "bf16"  # веса в bfloat16 (если процессор поддерживает)
+QUANTIZATION_MODES = (QUANTIZATION_NONE, QUANTIZATION_INT8, QUANTIZATION_BF16)
+
+MODEL_QUANTIZATION = os.getenv("MODEL_QUANTIZATION", QUANTIZATION_NONE)
+
+# Файл с квантизованной моделью в кэше
+QUANTIZED_MODEL_FILE = "model.pt"
+
+def bf16_supported(device: str = "cpu") -> bool:
+    if device == "cuda":
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    for check in ("_is_avx512_bf16_supported", "_is_amx_tile_supported"):
+        fn = getattr(torch.cpu, check, None)
+        if fn is not None and fn():
+            return True
+    return False
+
+def effective_quantization(mode: str) -> str:
+    """Режим, который будет применён на самом деле (bf16 без поддержки процессора — fp32)"""
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"❌ Неизвестный режим квантизации: {mode} (доступны: {', '.join(QUANTIZATION_MODES)})")
+    if mode == QUANTIZATION_BF16 and not bf16_supported():
+        return QUANTIZATION_NONE
+    return mode
+
+def quantize_model(model, mode: str):
+    """Квантизует модель transformers в памяти"""
+    if mode == QUANTIZATION_INT8:
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if mode == QUANTIZATION_BF16:
+        return model.to(torch.bfloat16)
+    return model
+
+def _cache_stamp(revision: str, mode: str) -> str:
+    # Сохранённая модель — pickle с классами torch и transformers, поэтому привязана к их версиям
+    return f"{revision}|{mode}|torch {torch.__version__}|transformers {transformers.__version__}"
+
+def load_quantized_model(name: str, model_path: str, revision: str, mode: str, cache_dir: str):
+    """Загружает квантизованную модель из кэша или квантизует её один раз и сохраняет.
+
+    Если bf16 не поддерживается процессором, возвращается обычная fp32-модель.
+    """
+    requested, mode = mode, effective_quantization(mode)
+    if mode != requested:
+        print("⚠️ bfloat16 не поддерживается процессором, модель остаётся в fp32")
+    if mode == QUANTIZATION_NONE:
+        return AutoModelForSeq2SeqLM.from_pretrained(model_path), mode
+
+    output_dir = converted_model_dir(cache_dir, f"torch-{mode}", name)
+    stamp_path = os.path.join(output_dir, REVISION_FILE)
+    model_file = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+    stamp = _cache_stamp(revision, mode)
+    if os.path.exists(stamp_path) and os.path.exists(model_file):
+        with open(stamp_path, encoding="utf-8") as f:
+            cached = f.read().strip() == stamp
+        if cached:
+            try:
+                model = torch.load(model_file, map_location="cpu", weights_only=False)
+                model.eval()
+                print(f"✅ Квантизованная модель ({mode}) загружена из кэша: {output_dir}")
+                return model, mode
+            except Exception as e:
+                # Повреждённый или несовместимый кэш не должен ронять запуск — квантизуем заново
+                logger.warning(f"Не удалось загрузить квантизованную модель {name} из кэша: {e}")
+
+    print(f"🔧 Квантизуем модель {name} ({mode}), выполняется один раз...")
+    model = quantize_model(AutoModelForSeq2SeqLM.from_pretrained(model_path), mode)
+    model.eval()
+    try:
+        tmp_dir = output_dir + ".tmp"
+        rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        torch.save(model, os.path.join(tmp_dir, QUANTIZED_MODEL_FILE))
+        with open(os.path.join(tmp_dir, REVISION_FILE), "w", encoding="utf-8") as f:
+            f.write(stamp)
+        rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+        print(f"✅ Квантизованная модель сохранена: {output_dir}")
+    except Exception as e:
+        # Без кэша бот всё равно работает, просто следующий запуск снова квантизует
+        logger.warning(f"Не удалось сохранить квантизованную модель {name}: {e}")
+    return model, mode
+
+def benchmark(modes: List[str], repeats: int = 3) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Задержка, прирост RSS и расхождение с fp32 для каждого режима на PARITY_TEXTS.
+
+    Квантизованные модели берутся из кэша, поэтому первый запуск стоит повторить:
+    при квантизации в памяти временно находится и fp32-копия.
+    """
+    import sacrebleu
+    from transformers import AutoConfig, AutoTokenizer
+    from download_model import SIMPLIFY_MODEL_PATH, TRANSLATE_MODEL_NAME, CONVERTED_MODEL_DIR, get_model_revision
+    from utils import simplify_batch, translate_batch
+    from profiles import PROFILE_FAST
+
+    runners = {
+        "simplify": (SIMPLIFY_MODEL_PATH, lambda texts, tok, model: simplify_batch(
+            texts, "medium", tok, model, "cpu", profile=PROFILE_FAST
+        )),
+        "translator": (TRANSLATE_MODEL_NAME, lambda texts, tok, model: translate_batch(
+            texts, tok, model, "cpu", profile=PROFILE_FAST
+        )),
+    }
+    report = {}
+    for name, (model_path, run) in runners.items():
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        revision = get_model_revision(model_path, AutoConfig.from_pretrained(model_path))
+        reference = None
+        report[name] = {}
+        for mode in [QUANTIZATION_NONE] + [m for m in modes if m != QUANTIZATION_NONE]:
+            gc.collect()
+            rss_before = current_rss_mb()
+            model, actual = load_quantized_model(name, model_path, revision, mode, CONVERTED_MODEL_DIR)
+            if actual != mode:
+                continue
+            rss = current_rss_mb() - rss_before
+
+            run(PARITY_TEXTS[:1], tokenizer, model)  # прогрев
+            start = time.perf_counter()
+            for _ in range(repeats):
+                outputs = run(PARITY_TEXTS, tokenizer, model)
+            latency = (time.perf_counter() - start) / repeats / len(PARITY_TEXTS)
+
+            if reference is None:
+                reference = outputs
+            same = sum(a.strip() == b.strip() for a, b in zip(outputs, reference)) / len(outputs)
+            chrf = sacrebleu.corpus_chrf(outputs, [reference]).score
+            report[name][mode] = {"latency_s": latency, "rss_mb": rss, "same_%": same * 100, "chrf": chrf}
+            print(f"📊 {name} [{mode}]: {latency:.2f} с/текст, +{rss:.0f} МБ RSS, "
+                  f"совпадает с fp32 {same * 100:.0f}%, chrF {chrf:.1f}")
+            del model
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк квантизации моделей упрощения и перевода на CPU")
+    parser.add_argument("--modes", nargs="+", choices=QUANTIZATION_MODES,
+                        default=[QUANTIZATION_INT8, QUANTIZATION_BF16])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+    torch.set_grad_enabled(False)
+    benchmark(args.modes, args.repeats)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
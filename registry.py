@@ -0,0 +1,211 @@
+import gc
+import os
+import sys
+import time
+import resource
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Бюджет памяти на модели (МБ, 0 — без ограничения)
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Через сколько секунд простоя модель выгружается (0 — только при нехватке бюджета)
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "0"))
+# Модели, которые загружаются сразу и никогда не выгружаются
+MODEL_PINNED = tuple(name.strip() for name in os.getenv("MODEL_PINNED", "simplify").split(",") if name.strip())
+
+def current_rss_mb() -> float:
+    """Текущий объём резидентной памяти процесса (МБ)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        # Не Linux: пиковое значение вместо текущего
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def _module_size_mb(obj: Any) -> Optional[float]:
+    """Размер параметров и буферов torch-модуля; None — не torch-модуль"""
+    if not hasattr(obj, "parameters") or not hasattr(obj, "buffers"):
+        return None
+    try:
+        tensors = list(obj.parameters()) + list(obj.buffers())
+    except TypeError:
+        return None
+    return sum(t.numel() * t.element_size() for t in tensors) / 1024 ** 2
+
+class _ModelGroup:
+    """Модели, которые загружаются и выгружаются вместе (например, токенизатор и модель)"""
+
+    def __init__(self, name: str, loader: Callable[[], Dict[str, Any]], pinned: bool):
+        self.name = name
+        self.loader = loader
+        self.pinned = pinned
+        self.objects: Optional[Dict[str, Any]] = None
+        self.size_mb = 0.0
+        self.refs = 0
+        self.last_used = 0.0
+        self.load_lock = threading.Lock()
+
+class ModelRegistry:
+    """Реестр моделей: загрузка при первом использовании, бюджет памяти и выгрузка LRU.
+
+    Модели берутся через use(names); пока контекст открыт, их группы не выгружаются.
+    Закреплённые (pinned) группы не выгружаются никогда.
+    """
+
+    def __init__(self, constants: Optional[Dict[str, Any]] = None,
+                 budget_mb: float = MODEL_MEMORY_BUDGET_MB, idle_seconds: float = MODEL_IDLE_SECONDS,
+                 pinned: Iterable[str] = MODEL_PINNED):
+        self.constants = dict(constants or {})
+        self.budget_mb = budget_mb
+        self.idle_seconds = idle_seconds
+        self.pinned = set(pinned)
+        self._groups: Dict[str, _ModelGroup] = {}
+        self._owners: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, group: str, names: Tuple[str, ...], loader: Callable[[], Dict[str, Any]]):
+        """loader() возвращает словарь {имя: объект} со всеми names"""
+        self._groups[group] = _ModelGroup(group, loader, group in self.pinned)
+        for name in names:
+            self._owners[name] = group
+
+    def preload(self):
+        """Загружает закреплённые группы заранее"""
+        for group in self._groups.values():
+            if group.pinned:
+                self._acquire(group)
+                self._release(group)
+
+    @property
+    def used_mb(self) -> float:
+        return sum(group.size_mb for group in self._groups.values() if group.objects is not None)
+
+    def loaded(self) -> Tuple[str, ...]:
+        return tuple(name for name, group in self._groups.items() if group.objects is not None)
+
+    @contextmanager
+    def use(self, names: Iterable[str]):
+        """Отдаёт словарь {имя: объект}, загружая недостающие группы"""
+        names = tuple(names)
+        groups = sorted({self._owners[name] for name in names if name in self._owners})
+        acquired = []
+        try:
+            for group in groups:
+                self._acquire(self._groups[group])
+                acquired.append(self._groups[group])
+            result = {}
+            for name in names:
+                if name in self.constants:
+                    result[name] = self.constants[name]
+                else:
+                    result[name] = self._groups[self._owners[name]].objects[name]
+            yield result
+        finally:
+            for group in acquired:
+                self._release(group)
+            with self._lock:
+                # Группы, которые держались во время загрузки, теперь можно выгрузить
+                self._make_room(0.0, keep=None, warn=False)
+            self.unload_idle()
+
+    def get(self, name: str) -> Any:
+        """Объект по имени без удержания группы (для разовых обращений)"""
+        with self.use((name,)) as objects:
+            return objects[name]
+
+    def pin(self, group: str):
+        with self._lock:
+            self.pinned.add(group)
+            self._groups[group].pinned = True
+
+    def unpin(self, group: str):
+        with self._lock:
+            self.pinned.discard(group)
+            self._groups[group].pinned = False
+
+    def _acquire(self, group: _ModelGroup):
+        with group.load_lock:
+            with self._lock:
+                if group.objects is not None:
+                    group.refs += 1
+                    group.last_used = time.monotonic()
+                    return
+                # Размер известен по прошлой загрузке — освобождаем место заранее
+                self._make_room(group.size_mb, keep=group)
+
+            print(f"📥 Загружаем модели «{group.name}»...")
+            start = time.monotonic()
+            rss_before = current_rss_mb()
+            objects = group.loader()
+            sizes = [_module_size_mb(obj) for obj in objects.values()]
+            if any(size is not None for size in sizes):
+                size_mb = sum(size for size in sizes if size is not None)
+            else:
+                size_mb = max(0.0, current_rss_mb() - rss_before)
+            elapsed = time.monotonic() - start
+            metrics.inc(f"model_load_{group.name}")
+            metrics.observe("model_load", elapsed)
+            print(f"✅ Модели «{group.name}» загружены за {elapsed:.1f} с (~{size_mb:.0f} МБ)")
+
+            with self._lock:
+                group.objects = objects
+                group.size_mb = size_mb
+                group.refs += 1
+                group.last_used = time.monotonic()
+                self._make_room(0.0, keep=group)
+                metrics.gauge("models_memory_mb", round(self.used_mb))
+
+    def _release(self, group: _ModelGroup):
+        with self._lock:
+            group.refs -= 1
+            group.last_used = time.monotonic()
+
+    def _make_room(self, needed_mb: float, keep: Optional[_ModelGroup], warn: bool = True):
+        """Выгружает простаивающие группы (самые давние первыми), пока не уложимся в бюджет"""
+        if not self.budget_mb:
+            return
+        while self.used_mb + needed_mb > self.budget_mb:
+            idle = [
+                group for group in self._groups.values()
+                if group.objects is not None and not group.refs and not group.pinned and group is not keep
+            ]
+            if not idle:
+                if warn:
+                    logger.warning(
+                        f"Бюджет памяти моделей превышен: {self.used_mb + needed_mb:.0f} из {self.budget_mb:.0f} МБ, "
+                        "выгружать нечего"
+                    )
+                return
+            self._unload(min(idle, key=lambda group: group.last_used), "бюджет памяти")
+
+    def unload_idle(self):
+        """Выгружает группы, которые не использовались дольше MODEL_IDLE_SECONDS"""
+        if not self.idle_seconds:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for group in self._groups.values():
+                if (group.objects is not None and not group.refs and not group.pinned
+                        and now - group.last_used > self.idle_seconds):
+                    self._unload(group, "простой")
+
+    def _unload(self, group: _ModelGroup, reason: str):
+        print(f"🧹 Выгружаем модели «{group.name}» ({reason}, ~{group.size_mb:.0f} МБ)")
+        group.objects = None
+        metrics.inc(f"model_unload_{group.name}")
+        metrics.gauge("models_memory_mb", round(self.used_mb))
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
@@ -0,0 +1,76 @@
+import os
+import time
+import asyncio
+from typing import Dict, List, Tuple
+
+# Ключ очереди: (класс задачи, стоимость со старением)
+Score = Tuple[int, float]
+
+# Виды задач инференса
+JOB_CLAIM = "claim"              # короткий текст или утверждение (микро-батч)
+JOB_TEXT = "text"                # длинный текст, упрощаемый по частям
+JOB_TRANSLATE = "translate"      # перевод чанков
+JOB_POSTEDIT = "postedit"        # доработка перевода через BERT
+JOB_SPECULATIVE = "speculative"  # фоновое упрощение, результат никто не ждёт
+
+# Настройки планировщика: сначала короткие задачи, долгое ожидание повышает приоритет
+SCHEDULER_CHARS_PER_TOKEN = float(os.getenv("SCHEDULER_CHARS_PER_TOKEN", "4"))
+SCHEDULER_AGING_RATE = float(os.getenv("SCHEDULER_AGING_RATE", "100"))  # токенов за секунду ожидания
+
+# Относительная стоимость токена по видам задач (beam search, BERT и т.д.)
+JOB_COST_WEIGHTS: Dict[str, float] = {
+    JOB_CLAIM: 1.0,
+    JOB_TEXT: 1.2,
+    JOB_TRANSLATE: 1.5,
+    JOB_POSTEDIT: 0.2,
+    JOB_SPECULATIVE: 1.2,
+}
+# Классы задач: задача младшего класса выбирается, только если старших в очереди нет.
+# Фоновая работа не стареет до уровня запросов пользователей, сколько бы ни ждала
+JOB_CLASSES: Dict[str, int] = {
+    JOB_SPECULATIVE: 1,
+}
+
+def estimate_tokens(args: tuple) -> int:
+    """Оценивает число входных токенов по строкам в аргументах задачи.
+
+    Токенизатор не вызывается: он используется потоком инференса одновременно.
+    """
+    chars = 0
+    for arg in args:
+        if isinstance(arg, str):
+            chars += len(arg)
+        elif isinstance(arg, (list, tuple)):
+            chars += sum(len(item) for item in arg if isinstance(item, str))
+    return max(1, int(chars / SCHEDULER_CHARS_PER_TOKEN))
+
+def job_cost(kind: str, tokens: int) -> float:
+    """Оценка стоимости задачи в «токенах»"""
+    return JOB_COST_WEIGHTS.get(kind, 1.0) * tokens
+
+def job_score(kind: str, tokens: int, enqueued_at: float, aging_rate: float = SCHEDULER_AGING_RATE) -> Score:
+    """Ключ очереди: меньше — раньше; сначала класс задачи, затем стоимость.
+
+    Старение: cost - rate * (now - enqueued_at) упорядочивает задачи так же,
+    как cost + rate * enqueued_at, поэтому ключ вычисляется один раз при постановке.
+    """
+    return JOB_CLASSES.get(kind, 0), job_cost(kind, tokens) + aging_rate * enqueued_at
+
+class ShortestJobQueue(asyncio.PriorityQueue):
+    """Очередь «сначала короткие» со старением и номером места в очереди.
+
+    Элементы — кортежи (score, seq, job).
+    """
+
+    def __init__(self, maxsize: int = 0, aging_rate: float = SCHEDULER_AGING_RATE):
+        super().__init__(maxsize)
+        self.aging_rate = aging_rate
+
+    def score(self, kind: str, tokens: int) -> Tuple[Score, float]:
+        """Возвращает (score, enqueued_at) для новой задачи"""
+        now = time.monotonic()
+        return job_score(kind, tokens, now, self.aging_rate), now
+
+    def ranking(self) -> List:
+        """Ожидающие задачи в порядке, в котором они будут выбраны"""
+        return [item[-1] for item in sorted(self._queue)]
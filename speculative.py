@@ -0,0 +1,56 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Any
+
+import pipeline
+from cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+# Фоновое упрощение текста сразу после загрузки (по умолчанию выключено)
+SPECULATIVE_SIMPLIFY = os.getenv("SPECULATIVE_SIMPLIFY", "0") == "1"
+
+class SpeculativePrecomputer:
+    """Заранее упрощает загруженный текст, пока пользователь выбирает уровень.
+
+    Сначала считается средний уровень, сильный — только если исполнитель
+    свободен. Задачи идут с низшим приоритетом и отменяются при новом тексте.
+    """
+
+    def __init__(self, bot_data: Dict[str, Any], enabled: bool = SPECULATIVE_SIMPLIFY):
+        self.bot_data = bot_data
+        self.enabled = enabled
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._tokens: Dict[int, CancellationToken] = {}
+
+    def start(self, user_id: int, text: str):
+        self.cancel(user_id)
+        if not self.enabled:
+            return
+        token = CancellationToken()
+        task = asyncio.create_task(self._run(text, token))
+        self._tasks[user_id] = task
+        self._tokens[user_id] = token
+        task.add_done_callback(lambda t: self._forget(user_id, t))
+
+    def cancel(self, user_id: int):
+        """Снимает фоновую задачу из очереди и останавливает уже начатую генерацию"""
+        task = self._tasks.pop(user_id, None)
+        token = self._tokens.pop(user_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+        if token is not None:
+            token.cancel()
+
+    def _forget(self, user_id: int, task: asyncio.Task):
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+            self._tokens.pop(user_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Ошибка фонового упрощения: {task.exception()}")
+
+    async def _run(self, text: str, token: CancellationToken):
+        await pipeline.precompute_simplify(self.bot_data, text, "medium", cancel_token=token)
+        if not token.cancelled and self.bot_data['inference'].idle:
+            await pipeline.precompute_simplify(self.bot_data, text, "strong", cancel_token=token)
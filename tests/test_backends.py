@@ -0,0 +1,62 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+import torch
+
+import backends
+
+class FakeTokenizer:
+    def convert_ids_to_tokens(self, ids):
+        return [str(i) for i in ids]
+
+    def convert_tokens_to_ids(self, tokens):
+        return [int(t) for t in tokens]
+
+class FakeTranslator:
+    """Возвращает вход как перевод и запоминает размеры частей партии"""
+
+    def __init__(self, on_batch=None):
+        self.batches = []
+        self.on_batch = on_batch
+
+    def translate_batch(self, source, callback=None, **options):
+        self.batches.append(len(source))
+        if self.on_batch is not None:
+            self.on_batch()
+        return [SimpleNamespace(hypotheses=[tokens]) for tokens in source]
+
+def make_model(translator, sub_batch=2):
+    config = SimpleNamespace(decoder_start_token_id=0, pad_token_id=0)
+    return backends.CTranslate2Seq2Seq(translator, FakeTokenizer(), config, beam_sub_batch=sub_batch)
+
+def test_beam_search_stops_between_sub_batches():
+    cancelled = []
+    translator = FakeTranslator(on_batch=lambda: cancelled.append(True))
+    model = make_model(translator)
+    input_ids = torch.tensor([[5, 6], [7, 8], [9, 10], [11, 12], [13, 14], [15, 16]])
+
+    output = model.generate(input_ids=input_ids, num_beams=4, stopping_criteria=[lambda ids, scores: bool(cancelled)])
+
+    # Отмена замечена после первой части, остальные примеры не переводились
+    assert translator.batches == [2]
+    assert output.shape[0] == 6
+    assert output[0].tolist() == [0, 5, 6]
+    assert output[5].tolist() == [0, 0, 0]
+
+def test_beam_search_without_criteria_is_one_batch():
+    translator = FakeTranslator()
+    model = make_model(translator)
+    output = model.generate(input_ids=torch.tensor([[5], [6], [7]]), num_beams=4)
+    assert translator.batches == [3]
+    assert output[:, 1].tolist() == [5, 6, 7]
+
+def test_ctranslate2_parity_with_torch():
+    pytest.importorskip("ctranslate2")
+    from download_model import SIMPLIFY_MODEL_PATH
+    if not os.path.isdir(SIMPLIFY_MODEL_PATH):
+        pytest.skip("модель упрощения не загружена (python download_model.py)")
+    assert backends.main(["parity", "--backend", "ctranslate2"]) == 0
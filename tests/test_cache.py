@@ -0,0 +1,33 @@
+import sqlite3
+
+from cache import ResultCache
+
+def read_rows(path):
+    with sqlite3.connect(path) as db:
+        return {key: (created, accessed) for key, created, accessed in
+                db.execute("SELECT key, created, accessed FROM test_cache")}
+
+def test_disk_hits_do_not_commit_until_flush(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache("test_cache", memory_items=1, path=path, flush_seconds=3600)
+    cache.put("a", "1")
+    cache.put("b", "2")  # «a» вытеснен из памяти, следующий get идёт на диск
+    assert read_rows(path) == {}
+
+    assert cache.get("a") == "1"
+    # Время доступа только запомнено, на диск ничего не записано
+    assert "a" in cache._accessed
+    assert read_rows(path) == {}
+
+    cache.close()
+    rows = read_rows(path)
+    assert set(rows) == {"a", "b"}
+    created, accessed = rows["a"]
+    assert accessed >= created
+
+def test_flush_after_interval(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache("test_cache", path=path, flush_seconds=0)
+    cache.put("a", "1")
+    assert set(read_rows(path)) == {"a"}
+    cache.close()
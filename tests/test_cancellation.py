@@ -0,0 +1,26 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("telegram")
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from cancellation import is_superseding_update
+
+USER = User(id=1, first_name="u", is_bot=False)
+
+def callback_update(data: str) -> Update:
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=1, type="private"))
+    query = CallbackQuery(id="1", from_user=USER, chat_instance="1", data=data, message=message)
+    return Update(update_id=1, callback_query=query)
+
+@pytest.mark.parametrize("data", [
+    "simplify_medium", "simplify_strong", "translate",
+    "fc:s:0", "fc:s:3:strong", "fc:all", "fc:sel",
+])
+def test_generation_buttons_supersede(data):
+    assert is_superseding_update(callback_update(data))
+
+@pytest.mark.parametrize("data", ["fc:p:1", "fc:t:2", "fc:l:0", "fc:noop", "show_original", "fact_checking"])
+def test_navigation_buttons_do_not_supersede(data):
+    assert not is_superseding_update(callback_update(data))
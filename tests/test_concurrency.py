@@ -0,0 +1,42 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("telegram")
+from telegram import Chat, Message, Update, User
+
+from concurrency import PerUserUpdateProcessor
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name="u", is_bot=False)
+    message = Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+        from_user=user, text="/start"
+    )
+    return Update(update_id=update_id, message=message)
+
+def test_second_user_not_blocked_by_first_user_queue():
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=3)
+        finished = {}
+        start = time.monotonic()
+
+        async def handle(name: str):
+            await asyncio.sleep(0.2)
+            finished[name] = time.monotonic() - start
+
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(i, 1), handle(f"a{i}")))
+            for i in range(5)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(make_update(100, 2), handle("b"))))
+        await asyncio.gather(*tasks)
+        return finished
+
+    finished = asyncio.run(scenario())
+    # Пять обновлений первого пользователя идут по очереди, второй пользователь не ждёт их
+    assert finished["b"] < 0.4
+    assert finished["a4"] >= 0.95
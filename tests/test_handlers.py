@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("torch", "transformers", "telegram", "docx", "chardet", "nltk", "langdetect"):
+    pytest.importorskip(module)
+import handlers
+from handlers import CLAIMS_PER_PAGE, CLAIM_PREVIEW_CHARS, render_fact_check_page, stats_command, warn_if_long
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def test_fact_check_page_fits_telegram_limit():
+    # Утверждения максимальной длины, почти целиком из символов, которые экранируются
+    claim = "*_`[" * (CLAIM_PREVIEW_CHARS // 4 + 50)
+    claims = [claim] * (CLAIMS_PER_PAGE * 2)
+    context = SimpleNamespace(user_data={'fact_check_claims': claims, 'selected_claims': set(range(len(claims)))})
+
+    text, _ = render_fact_check_page(context, 0)
+
+    assert len(text.encode("utf-16-le")) // 2 <= TELEGRAM_MESSAGE_LIMIT
+    # Все утверждения страницы на месте, и ни одно не заканчивается висящим экранированием
+    for i in range(CLAIMS_PER_PAGE):
+        assert f"*{i + 1}.*" in text
+    for line in text.split("\n\n")[1:]:
+        assert line.endswith("…") and not line[:-1].endswith("\\")
+
+def test_stats_only_for_admins(monkeypatch):
+    replies = []
+
+    async def reply(message, text, **kwargs):
+        replies.append(text)
+
+    monkeypatch.setattr(handlers.outbound, "reply", reply)
+    monkeypatch.setattr(handlers, "STATS_ADMIN_IDS", {1})
+    monkeypatch.setattr(handlers.metrics, "format_report", lambda: "metrics report")
+
+    for user_id in (2, 1):
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=None)
+        asyncio.run(stats_command(update, None))
+
+    # Посторонний пользователь метрик не видит
+    assert replies[0] != "metrics report"
+    assert replies[1] == "metrics report"
+
+def test_long_text_warning_counts_model_tokens(monkeypatch):
+    replies = []
+
+    async def reply(message, text, **kwargs):
+        replies.append(text)
+
+    monkeypatch.setattr(handlers.outbound, "reply", reply)
+    update = SimpleNamespace(message=None)
+    text = "Слово. " * 1500
+
+    # Длина в символах не важна: предупреждение зависит от числа частей по токенам
+    asyncio.run(warn_if_long(update, text, {"spans": ((0, len(text)),), "tokens": (500,)}))
+    assert replies == []
+    asyncio.run(warn_if_long(update, text, {"spans": ((0, len(text)),), "tokens": (50000,)}))
+    assert len(replies) == 1
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("telegram")
+from cancellation import CancellationToken, GenerationCancelled
+from inference import InferenceExecutor
+from scheduler import JOB_CLAIM, JOB_SPECULATIVE
+
+class FakeRegistry:
+    def preload(self):
+        pass
+
+    @contextmanager
+    def use(self, uses):
+        yield {}
+
+def long_generation(seconds: float, cancel_token=None):
+    """Имитация генерации, которая проверяет токен между шагами"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        time.sleep(0.01)
+    return "done"
+
+def quick(value):
+    return value
+
+async def start_executor():
+    executor = InferenceExecutor(FakeRegistry(), mode="thread", workers=1)
+    await executor.start()
+    return executor
+
+async def wait_started(job):
+    while not job.started:
+        await asyncio.sleep(0.01)
+
+def test_cancel_running_speculative_job():
+    async def scenario():
+        executor = await start_executor()
+        token = CancellationToken()
+        job = executor.try_submit(long_generation, 2.0, cancel_token=token, kind=JOB_SPECULATIVE)
+        await wait_started(job)
+        start = time.monotonic()
+        token.cancel()
+        with pytest.raises(GenerationCancelled):
+            await job.future
+        elapsed = time.monotonic() - start
+        await executor.stop()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
+
+def test_foreground_job_preempts_running_speculative_job():
+    async def scenario():
+        executor = await start_executor()
+        job = executor.try_submit(long_generation, 2.0, cancel_token=CancellationToken(), kind=JOB_SPECULATIVE)
+        await wait_started(job)
+        start = time.monotonic()
+        result = await executor.run(quick, "claim", kind=JOB_CLAIM)
+        elapsed = time.monotonic() - start
+        with pytest.raises(GenerationCancelled):
+            await job.future
+        await executor.stop()
+        return result, elapsed
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == "claim"
+    assert elapsed < 0.5
+
+def test_joined_speculative_job_is_not_preempted():
+    async def scenario():
+        executor = await start_executor()
+        job = executor.try_submit(long_generation, 0.3, cancel_token=CancellationToken(), kind=JOB_SPECULATIVE)
+        await wait_started(job)
+        # Результат ждёт пользователь, как в pipeline._simplify_uncached
+        job.preemptible = False
+        await executor.run(quick, "claim", kind=JOB_CLAIM)
+        result = await job.future
+        await executor.stop()
+        return result
+
+    assert asyncio.run(scenario()) == "done"
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+for module in ("torch", "transformers", "telegram", "docx", "chardet", "nltk", "langdetect"):
+    pytest.importorskip(module)
+import pipeline
+from cache import ResultCache
+from cancellation import CancellationToken
+
+class FakeInference:
+    """Переводит «предложение» в «EN:предложение» и запоминает, что переводилось"""
+
+    def __init__(self):
+        self.translated = []
+
+    async def run(self, fn, items, **kwargs):
+        assert fn is pipeline.translate_batch
+        self.translated.extend(items)
+        return [f"EN:{item}" for item in items]
+
+def make_bot_data():
+    return {
+        'inference': FakeInference(),
+        'translation_memory': ResultCache("test_translation_memory", path=None),
+    }
+
+def translate(bot_data, text):
+    return asyncio.run(pipeline._translate_uncached(bot_data, text, CancellationToken(), lang="en"))
+
+def long_text(prefix: str, *extra: str) -> str:
+    """Текст длиннее TRANSLATE_SHORT_TEXT, иначе он переводится целиком"""
+    sentences = [f"{prefix} sentence number {i} talks about topic {i}." for i in range(20)]
+    return " ".join(sentences + list(extra))
+
+def test_repeated_sentence_served_from_translation_memory():
+    bot_data = make_bot_data()
+    shared = "It is raining in the city today."
+    translate(bot_data, long_text("First", shared))
+    translated = bot_data['inference'].translated
+    assert shared in translated
+    before = len(translated)
+
+    # Другой текст с тем же предложением: оно берётся из памяти
+    result = translate(bot_data, long_text("Second", shared))
+    assert shared not in translated[before:]
+    assert len(translated[before:]) == 20
+    assert f"EN:{shared}" in result
+
+def test_edited_sentence_is_the_only_one_retranslated():
+    bot_data = make_bot_data()
+    translate(bot_data, long_text("Same", "The old ending sentence."))
+    before = len(bot_data['inference'].translated)
+    translate(bot_data, long_text("Same", "The new ending sentence."))
+    assert bot_data['inference'].translated[before:] == ["The new ending sentence."]
@@ -0,0 +1,12 @@
+from scheduler import JOB_CLAIM, JOB_SPECULATIVE, JOB_TEXT, job_score
+
+def test_old_speculative_job_never_beats_user_work():
+    speculative = job_score(JOB_SPECULATIVE, 2500, enqueued_at=0)
+    # Даже через час ожидания фоновая задача уступает новому длинному тексту
+    assert job_score(JOB_TEXT, 2500, enqueued_at=31) < speculative
+    assert job_score(JOB_TEXT, 100000, enqueued_at=3600) < speculative
+
+def test_aging_still_orders_user_jobs():
+    # Длинный текст, ждущий давно, обгоняет только что пришедший короткий запрос
+    assert job_score(JOB_TEXT, 2000, enqueued_at=0) < job_score(JOB_CLAIM, 50, enqueued_at=30)
+    assert job_score(JOB_CLAIM, 50, enqueued_at=30) < job_score(JOB_TEXT, 2000, enqueued_at=25)
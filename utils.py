@@ -1,501 +1,784 @@
+import io
 import os
 import re
+import math
+import time
 import asyncio
-import random
+from bisect import bisect_right
+from difflib import SequenceMatcher
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, Tuple
+
+import torch
+import chardet
+from transformers import TextStreamer, StoppingCriteria, StoppingCriteriaList
+from docx import Document
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils import (
-    send_typing_action, safe_edit_message, send_thinking_messages,
-    split_text, simplify_text, translate_text, evaluate_simplification,
-    get_main_keyboard, get_simplify_keyboard
-)
+from telegram.error import RetryAfter
+
+from profiles import PROFILE_QUALITY, PROFILE_BALANCED, get_profile_params
+from metrics import metrics
+from postedit import get_postedit_engine, make_bert_embedder
+from outbound import outbound
+from analysis import DEFAULT_LANGUAGE, detect_language, sentence_spans, split_sentences, span_token_counts
 
 logger = logging.getLogger(__name__)
 
-async def simplify_claim(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    claim_index = int(query.data.split('_')[-1])
-    claims = context.user_data.get('fact_check_claims', [])
-    
-    if not claims or claim_index >= len(claims):
-        await query.edit_message_text("❌ Утверждение не найдено.")
-        return
-    
-    claim = claims[claim_index]
-    
-    await query.edit_message_text(
-        f"📝 *Упрощение утверждения:*\n\n_{claim}_\n\n"
-        "⏳ Выполняется упрощение...",
-        parse_mode='Markdown'
-    )
-    
-    try:
-        # Используем модель упрощения с уровнем medium по умолчанию
-        simplified = simplify_text(
-            claim,
-            strength="medium",
-            simplify_tokenizer=context.bot_data['simplify_tokenizer'],
-            simplify_model=context.bot_data['simplify_model'],
-            device=context.bot_data['device']
-        )
-        
-        result_text = (
-            f"📝 *Упрощенное утверждение:*\n\n"
-            f"{simplified}\n\n"
-            f"📌 *Оригинал:*\n_{claim}_"
-        )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔄 Другой уровень", callback_data=f"change_claim_level_{claim_index}"),
-                InlineKeyboardButton("⬅️ Назад", callback_data="back_to_uploaded_text")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            result_text,
-            parse_mode='Markdown',
-            reply_markup=reply_markup
-        )
-    except Exception as e:
-        logger.error(f"Ошибка упрощения утверждения: {e}")
-        await query.edit_message_text(f"❌ Ошибка при упрощении утверждения: {e}")
-
-async def change_claim_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    claim_index = int(query.data.split('_')[-1])
-    claims = context.user_data.get('fact_check_claims', [])
-    
-    if not claims or claim_index >= len(claims):
-        await query.edit_message_text("❌ Утверждение не найдено.")
-        return
-    
-    # Сохраняем индекс утверждения для последующего использования
-    context.user_data['current_claim_index'] = claim_index
-    
-    keyboard = [
-        [
-            InlineKeyboardButton("⚖️ Средний", callback_data=f"simplify_claim_medium_{claim_index}"),
-            InlineKeyboardButton("🔥 Сильный", callback_data=f"simplify_claim_strong_{claim_index}")
-        ],
-        [
-            InlineKeyboardButton("⬅️ Назад", callback_data="back_to_uploaded_text")
+# --- Обновим константы для ограничений ---
+MAX_TEXT_LENGTH = 10000  # Максимальная длина текста в символах
+MAX_FILE_SIZE = 20 * 1024 * 1024  # 20 МБ
+MAX_PARTS_FOR_WARNING = 10  # Если частей больше этого, предупреждаем пользователя
+SIMPLIFY_MAX_INPUT_TOKENS = 1024  # Вход модели упрощения обрезается до этой длины
+# Длина выхода по уровням: (потолок max_length, запас сверх длины входа)
+SIMPLIFY_OUTPUT_LIMITS = {"strong": (160, 20), "medium": (350, 40)}
+# Осторожная оценка для выбора пути без токенизатора (на токен обычно приходится больше символов)
+SIMPLIFY_MIN_CHARS_PER_TOKEN = 2.5
+LONG_TEXT_BATCH_SIZE = int(os.getenv("LONG_TEXT_BATCH_SIZE", "8"))  # Частей в одном пакетном generate
+LONG_TEXT_BUCKET_RATIO = 1.5  # Допустимое отношение длин частей внутри одной корзины
+LONG_TEXT_MIN_WORD_RATIO = 0.5  # Часть, упрощённая короче этой доли слов, упрощается повторно
+TRANSLATE_SHORT_TEXT = 500  # Тексты короче переводятся целиком
+TRANSLATE_CHUNK_CHARS = 400  # Максимальный размер чанка для перевода
+TRANSLATE_BATCH_SIZE = int(os.getenv("TRANSLATE_BATCH_SIZE", "8"))  # Чанков в одном пакетном generate
+LONG_OUTPUT_CHARS = int(os.getenv("LONG_OUTPUT_CHARS", "3500"))  # Тексты длиннее отправляются файлом
+LONG_OUTPUT_FORMAT = os.getenv("LONG_OUTPUT_FORMAT", "txt")  # Формат файла: txt или docx
+
+# Успешные промпты
+SIMPLIFY_PROMPTS = {
+    "strong": "Сделай максимально простой пересказ для школьника: ",
+    "medium": "Упрости текст, сохранив основную мысль: "
+}
+
+# Используем специальный токен как разделитель
+SIMPLIFY_SEPARATOR = "|||"
+
+# Детерминированное декодирование (без сэмплирования) делает результаты воспроизводимыми
+SIMPLIFY_DETERMINISTIC = os.getenv("SIMPLIFY_DETERMINISTIC", "0") == "1"
+
+# --- Функции работы с текстом ---
+def build_simplify_prompt(text, strength="medium"):
+    return SIMPLIFY_PROMPTS.get(strength, SIMPLIFY_PROMPTS["medium"]) + SIMPLIFY_SEPARATOR + text.strip()
+
+# --- Разбиение на части по токенам ---
+def simplify_chunk_tokens(strength="medium", prompt_tokens=0):
+    """Сколько токенов текста можно подать в одну часть, чтобы ни вход, ни выход не обрезались.
+
+    Выход ограничен min(потолок, длина входа + запас), поэтому вход вместе с промптом
+    не должен превышать потолок за вычетом запаса.
+    """
+    cap, slack = SIMPLIFY_OUTPUT_LIMITS.get(strength, SIMPLIFY_OUTPUT_LIMITS["medium"])
+    return max(1, min(SIMPLIFY_MAX_INPUT_TOKENS, cap - slack) - prompt_tokens)
+
+def estimate_simplify_parts(text, strength="medium", analysis=None):
+    """Оценка без токенизатора: на сколько частей разобьётся текст при упрощении.
+
+    С разбором текста (analysis) число токенов известно точно.
+    """
+    prompt = build_simplify_prompt("", strength)
+    budget = simplify_chunk_tokens(strength, math.ceil(len(prompt) / SIMPLIFY_MIN_CHARS_PER_TOKEN))
+    if analysis is not None and analysis.get("tokens") is not None:
+        tokens = sum(analysis["tokens"])
+    else:
+        tokens = math.ceil(len(text.strip()) / SIMPLIFY_MIN_CHARS_PER_TOKEN)
+    return max(1, math.ceil(tokens / budget))
+
+def fits_single_chunk(text, strength="medium", analysis=None):
+    """Оценка без токенизатора: поместится ли текст в одну часть"""
+    return estimate_simplify_parts(text, strength, analysis) <= 1
+
+def word_token_counts(text, tokenizer):
+    """Слова текста с числом токенов: [(start, end, tokens)]"""
+    words = [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]
+    return [(s, e, n) for (s, e), n in zip(words, span_token_counts(text, words, tokenizer))]
+
+def sentence_token_counts(text, tokenizer, analysis=None):
+    """Предложения с числом токенов: [(start, end, tokens)]; из разбора текста, если он есть"""
+    if analysis is not None and analysis.get("tokens") is not None:
+        return [(s, e, n) for (s, e), n in zip(analysis["spans"], analysis["tokens"])]
+    lang = analysis["language"] if analysis is not None else DEFAULT_LANGUAGE
+    spans = sentence_spans(text, lang)
+    return [(s, e, n) for (s, e), n in zip(spans, span_token_counts(text, spans, tokenizer))]
+
+def _pack_units(units, max_tokens):
+    """Собирает подряд идущие единицы (start, end, tokens) в части примерно равной длины.
+
+    Число частей — минимально возможное при max_tokens; внутри этого числа части
+    выравниваются к средней длине, чтобы их можно было упрощать одной партией.
+    """
+    remaining = sum(n for _, _, n in units)
+    chunks_left = max(1, math.ceil(remaining / max_tokens))
+    chunks = []
+    current = []
+    size = 0
+    for unit in units:
+        tokens = unit[2]
+        target = remaining / chunks_left
+        if current and (size + tokens > max_tokens or abs(size + tokens - target) > abs(size - target)):
+            chunks.append((current[0][0], current[-1][1], size))
+            remaining -= size
+            chunks_left = max(1, chunks_left - 1)
+            current, size = [], 0
+        current.append(unit)
+        size += tokens
+    if current:
+        chunks.append((current[0][0], current[-1][1], size))
+    return chunks
+
+def split_text_by_tokens(text, tokenizer, max_tokens, analysis=None):
+    """Делит текст на части не длиннее max_tokens токенов по границам предложений.
+
+    Слишком длинные предложения делятся по словам. Возвращает список
+    (start, end, tokens); текст части — text[start:end].
+    """
+    units = []
+    for start, end, tokens in sentence_token_counts(text, tokenizer, analysis):
+        if tokens <= max_tokens:
+            units.append((start, end, tokens))
+            continue
+        words = word_token_counts(text[start:end], tokenizer)
+        units.extend(_pack_units([(start + s, start + e, n) for s, e, n in words], max_tokens))
+    return _pack_units(units, max_tokens) if units else []
+
+def plan_simplify_chunks(text, strength="medium", tokenizer=None, max_tokens=None, analysis=None):
+    """Части текста для упрощения: бюджет по токенам из лимита входа и выхода уровня strength"""
+    if max_tokens is None:
+        prompt_tokens = len(tokenizer(build_simplify_prompt("", strength))["input_ids"])
+        max_tokens = simplify_chunk_tokens(strength, prompt_tokens)
+    return split_text_by_tokens(text, tokenizer, max_tokens, analysis)
+
+def sub_analysis(analysis, start, end):
+    """Разбор фрагмента text[start:end]; None, если фрагмент режет предложение"""
+    if analysis is None or analysis.get("tokens") is None:
+        return None
+    spans, tokens = [], []
+    for (s, e), n in zip(analysis["spans"], analysis["tokens"]):
+        if e <= start or s >= end:
+            continue
+        if s < start or e > end:
+            return None
+        spans.append((s - start, e - start))
+        tokens.append(n)
+    return {"language": analysis["language"], "spans": tuple(spans), "tokens": tuple(tokens)}
+
+def get_simplify_generation_params(strength, shortest_input, longest_input, simplify_tokenizer,
+                                   profile=PROFILE_QUALITY):
+    """Параметры generate для партии входов длиной от shortest_input до longest_input токенов.
+
+    profile (quality / balanced / fast) задаёт число лучей и сэмплирование.
+    """
+    # Оптимизированные параметры
+    strong_cap, strong_slack = SIMPLIFY_OUTPUT_LIMITS["strong"]
+    medium_cap, medium_slack = SIMPLIFY_OUTPUT_LIMITS["medium"]
+    params = {
+        "strong": {
+            "max_length": min(strong_cap, longest_input + strong_slack),  # Увеличим для сохранения смысла
+            "min_length": max(30, shortest_input // 3),   # Увеличим минимальную длину
+            "length_penalty": 0.75,  # Сделаем менее агрессивным
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "repetition_penalty": 1.2
+        },
+        "medium": {
+            "max_length": min(medium_cap, longest_input + medium_slack),
+            "min_length": max(50, shortest_input // 2),
+            "length_penalty": 0.9,
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "repetition_penalty": 1.2
+        }
+    }
+
+    current_params = params[strength]
+
+    generation_params = {
+        "max_length": int(current_params["max_length"]),
+        "min_length": int(current_params["min_length"]),
+        "num_beams": 4,
+        "do_sample": not SIMPLIFY_DETERMINISTIC,
+        "length_penalty": float(current_params["length_penalty"]),
+        "repetition_penalty": float(current_params["repetition_penalty"]),
+        "no_repeat_ngram_size": 3,
+        "early_stopping": True,
+        "pad_token_id": simplify_tokenizer.pad_token_id,
+        "eos_token_id": simplify_tokenizer.eos_token_id
+    }
+    generation_params.update(get_profile_params("simplify", profile, strength))
+    if generation_params["num_beams"] == 1:
+        generation_params.pop("early_stopping")
+    # Параметры сэмплирования нужны только при do_sample=True
+    if generation_params["do_sample"]:
+        generation_params["top_p"] = float(current_params["top_p"])
+        generation_params["temperature"] = float(current_params["temperature"])
+
+    return generation_params
+
+def get_simplify_cache_params(strength="medium", profile=PROFILE_QUALITY):
+    """Параметры генерации, от которых зависит результат (входят в ключ кэша)"""
+    params = {"profile": profile, "do_sample": not SIMPLIFY_DETERMINISTIC}
+    params.update(get_profile_params("simplify", profile, strength))
+    return params
+
+def clean_simplified_output(result, original):
+    # Удаляем все до разделителя и сам разделитель
+    if SIMPLIFY_SEPARATOR in result:
+        result = result.split(SIMPLIFY_SEPARATOR, 1)[1].strip()
+    else:
+        patterns_to_remove = [
+            r"^.*?Сделай максимально простой пересказ для школьника:\s*",
+            r"^.*?Упрости текст, сохранив основную мысль:\s*"
         ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(
-        "Выбери уровень упрощения:",
-        reply_markup=reply_markup
-    )
 
-async def simplify_claim_with_strength(update: Update, context: ContextTypes.DEFAULT_TYPE, claim_index: int, strength: str):
-    query = update.callback_query
-    await query.answer()
-    
-    claims = context.user_data.get('fact_check_claims', [])
-    
-    if not claims or claim_index >= len(claims):
-        await query.edit_message_text("❌ Утверждение не найдено.")
-        return
-    
-    claim = claims[claim_index]
-    
-    await query.edit_message_text(
-        f"📝 *Упрощение утверждения ({strength}):*\n\n_{claim}_\n\n"
-        "⏳ Выполняется упрощение...",
-        parse_mode='Markdown'
+        for pattern in patterns_to_remove:
+            result = re.sub(pattern, "", result, flags=re.IGNORECASE | re.DOTALL)
+
+    # Минимальная очистка
+    result = re.sub(r"<extra_id_\d+>", "", result)
+    result = re.sub(r"\s+", " ", result).strip()
+
+    if not result or len(result) < 10:
+        return original
+
+    return result
+
+class CallbackStreamer(TextStreamer):
+    """Передаёт в callback текст, сгенерированный к текущему шагу"""
+
+    def __init__(self, tokenizer, callback):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.callback = callback
+        self.text = ""
+
+    def on_finalized_text(self, text, stream_end=False):
+        self.text += text
+        partial = self.text.split(SIMPLIFY_SEPARATOR, 1)[-1]
+        self.callback(re.sub(r"<extra_id_\d+>", "", partial).strip())
+
+class CancelledCriteria(StoppingCriteria):
+    """Останавливает generate на ближайшем шаге декодирования после отмены"""
+
+    def __init__(self, cancel_token):
+        self.cancel_token = cancel_token
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancel_token.cancelled
+
+def add_cancel_criteria(generation_params, cancel_token):
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+        generation_params["stopping_criteria"] = StoppingCriteriaList([CancelledCriteria(cancel_token)])
+
+def simplify_batch(texts, strength="medium", simplify_tokenizer=None, simplify_model=None, device=None,
+                   stream_callback=None, cancel_token=None, profile=PROFILE_QUALITY):
+    """Упрощает несколько текстов одного уровня одним пакетным вызовом generate.
+
+    stream_callback (только для одного текста) получает текст по мере генерации;
+    потоковый вывод несовместим с beam search, поэтому генерация идёт с num_beams=1.
+    """
+    results = list(texts)
+    if not all([simplify_tokenizer, simplify_model]):
+        return results
+
+    indices = [i for i, text in enumerate(texts) if text.strip()]
+    if not indices:
+        return results
+
+    prompts = [build_simplify_prompt(texts[i], strength) for i in indices]
+    inputs = simplify_tokenizer(
+        prompts,
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        max_length=SIMPLIFY_MAX_INPUT_TOKENS
+    ).to(device)
+
+    # Реальные длины без паддинга
+    input_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+    generation_params = get_simplify_generation_params(
+        strength, min(input_lengths), max(input_lengths), simplify_tokenizer, profile
     )
-    
-    try:
-        simplified = simplify_text(
-            claim,
-            strength=strength,
-            simplify_tokenizer=context.bot_data['simplify_tokenizer'],
-            simplify_model=context.bot_data['simplify_model'],
-            device=context.bot_data['device']
-        )
-        
-        result_text = (
-            f"📝 *Упрощенное утверждение ({strength}):*\n\n"
-            f"{simplified}\n\n"
-            f"📌 *Оригинал:*\n_{claim}_"
+
+    if stream_callback is not None and len(prompts) == 1:
+        generation_params["num_beams"] = 1
+        generation_params["streamer"] = CallbackStreamer(simplify_tokenizer, stream_callback)
+
+    add_cancel_criteria(generation_params, cancel_token)
+
+    with torch.no_grad():
+        outputs = simplify_model.generate(
+            **inputs,
+            **generation_params
         )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🔄 Другой уровень", callback_data=f"change_claim_level_{claim_index}"),
-                InlineKeyboardButton("⬅️ Назад", callback_data="back_to_uploaded_text")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            result_text,
-            parse_mode='Markdown',
-            reply_markup=reply_markup
+
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+    decoded = simplify_tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    for i, result in zip(indices, decoded):
+        results[i] = clean_simplified_output(result, texts[i])
+
+    return results
+
+def simplify_text(text, strength="medium", simplify_tokenizer=None, simplify_model=None, device=None,
+                  stream_callback=None, cancel_token=None, profile=PROFILE_QUALITY):
+    if not text.strip() or not all([simplify_tokenizer, simplify_model]):
+        return text
+
+    return simplify_batch(
+        [text],
+        strength=strength,
+        simplify_tokenizer=simplify_tokenizer,
+        simplify_model=simplify_model,
+        device=device,
+        stream_callback=stream_callback,
+        cancel_token=cancel_token,
+        profile=profile
+    )[0]
+
+def plan_length_buckets(lengths, batch_size=LONG_TEXT_BATCH_SIZE, max_ratio=LONG_TEXT_BUCKET_RATIO):
+    """Группирует индексы частей в корзины похожей длины (не больше batch_size в каждой)"""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets = []
+    current = []
+    for i in order:
+        if current and (len(current) >= batch_size or lengths[i] > lengths[current[0]] * max_ratio):
+            buckets.append(current)
+            current = []
+        current.append(i)
+    if current:
+        buckets.append(current)
+    return buckets
+
+def simplify_parts(parts, strength="medium", simplify_tokenizer=None, simplify_model=None, device=None,
+                   progress_callback=None, cancel_token=None, profile=PROFILE_QUALITY):
+    """Упрощает части текста пакетно: по одному generate на корзину похожих длин, порядок сохраняется.
+
+    progress_callback(done, total, results) вызывается после каждой корзины;
+    в results ещё не готовые части равны None.
+    """
+    if not parts or not all([simplify_tokenizer, simplify_model]):
+        return list(parts)
+
+    prompts = [build_simplify_prompt(part, strength) for part in parts]
+    lengths = [len(ids) for ids in simplify_tokenizer(prompts, truncation=True, max_length=SIMPLIFY_MAX_INPUT_TOKENS)["input_ids"]]
+
+    results = [None] * len(parts)
+    for bucket in plan_length_buckets(lengths):
+        print(f"🔄 Пакетная обработка {len(bucket)} частей ({lengths[bucket[0]]}–{lengths[bucket[-1]]} токенов)...")
+        simplified = simplify_batch(
+            [parts[i] for i in bucket],
+            strength=strength,
+            simplify_tokenizer=simplify_tokenizer,
+            simplify_model=simplify_model,
+            device=device,
+            cancel_token=cancel_token,
+            profile=profile
         )
-    except Exception as e:
-        logger.error(f"Ошибка упрощения утверждения: {e}")
-        await query.edit_message_text(f"❌ Ошибка при упрощении утверждения: {e}")
-
-async def show_last_uploaded_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    text = context.user_data.get('pending_text', '').strip()
-    
-    if not text:
-        await safe_edit_message(query, "❌ Нет загруженного текста.")
-        return
-    
-    # Показываем оригинальный текст
-    try:
-        await query.delete_message()
-    except Exception as e:
-        logger.warning(f"Error deleting message: {e}")
-    
-    max_length = 4096 - 100
-    if len(text) <= max_length:
-        await query.message.reply_text(
-            f"📜 *Последний загруженный текст:*\n\n{text}",
-            parse_mode='Markdown'
+        for i, result in zip(bucket, simplified):
+            results[i] = result
+        if progress_callback is not None:
+            progress_callback(sum(r is not None for r in results), len(parts), list(results))
+    return results
+
+metrics.register_rate("Исправлено повторным упрощением", "simplify_retry_fixed", "simplify_retry_failed")
+
+def part_needs_retry(part, result):
+    """Часть «схлопнулась» или вернулась без изменений (clean_simplified_output отдал оригинал)"""
+    return result.strip() == part.strip() or len(result.split()) < len(part.split()) * LONG_TEXT_MIN_WORD_RATIO
+
+def retry_profile(profile):
+    """Другой профиль для повтора неделимой части"""
+    return PROFILE_BALANCED if profile == PROFILE_QUALITY else PROFILE_QUALITY
+
+def retry_failed_parts(parts, results, sizes, strength="medium", simplify_tokenizer=None,
+                       profile=PROFILE_QUALITY, **kwargs):
+    """Повторно упрощает только неудачные части, все повторы — общими партиями.
+
+    Часть делится пополам по токенам (меньшее окно); часть, которую уже не разделить,
+    повторяется с другим профилем. Новый результат принимается, только если он прошёл проверку.
+    """
+    failed = [i for i, (part, result) in enumerate(zip(parts, results)) if part_needs_retry(part, result)]
+    if not failed:
+        return results
+
+    start = time.monotonic()
+    print(f"⚠️ Неудачных частей: {len(failed)} из {len(parts)}, упрощаем их повторно...")
+    jobs = {profile: [], retry_profile(profile): []}
+    for i in failed:
+        pieces = plan_simplify_chunks(parts[i], strength, simplify_tokenizer, max_tokens=max(1, math.ceil(sizes[i] / 2)))
+        if len(pieces) > 1:
+            jobs[profile].extend((i, parts[i][s:e]) for s, e, _ in pieces)
+        else:
+            jobs[retry_profile(profile)].append((i, parts[i]))
+
+    retried = {i: [] for i in failed}
+    for job_profile, items in jobs.items():
+        if not items:
+            continue
+        outputs = simplify_parts(
+            [text for _, text in items], strength=strength, simplify_tokenizer=simplify_tokenizer,
+            profile=job_profile, **kwargs
         )
-    else:
-        parts = split_text(text, max_chars=3500)
-        for i, part in enumerate(parts):
-            if part.strip():
-                text_part = f"📜 *Последний загруженный текст (часть {i+1}):*\n\n{part}"
-                await query.message.reply_text(text_part, parse_mode='Markdown')
-                await asyncio.sleep(0.5)
-    
-    # Добавляем кнопки для действий с текстом
-    keyboard = [
-        [InlineKeyboardButton("⚖️ Средний", callback_data="simplify_medium")],
-        [InlineKeyboardButton("🔥 Сильный", callback_data="simplify_strong")],
-        [InlineKeyboardButton("🔍 Фактчекинг", callback_data="fact_checking")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.message.reply_text(
-        "Выбери действие:",
-        reply_markup=reply_markup
-    )
+        for (i, _), output in zip(items, outputs):
+            retried[i].append(output)
 
-async def fact_check_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    help_text = (
-        "❓ *Помощь по режиму фактчекинга*\n\n"
-        "🔍 *Что это такое?*\n"
-        "Режим фактчекинга анализирует текст и выделяет отдельные утверждения, которые можно проверить на достоверность.\n\n"
-        "📋 *Как использовать:*\n"
-        "1. Отправьте текст или загрузите файл\n"
-        "2. Выберите режим 'Фактчекинг'\n"
-        "3. Бот разобьет текст на утверждения\n"
-        "4. Для каждого утверждения доступны действия:\n"
-        "   • 📝 *Упростить* - упростить утверждение\n\n"
-        "⚠️ *Важно:*\n"
-        "• Бот не заменяет профессиональную экспертизу\n"
-        "• Результаты носят рекомендательный характер\n"
-        "• Для важных решений всегда проверяйте несколько источников\n\n"
-        "💡 *Совет:* Начните с проверки наиболее важных или спорных утверждений."
-    )
-    keyboard = [
-        [
-            InlineKeyboardButton("⬅️ Назад к утверждениям", callback_data="back_to_fact_check")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
-        help_text,
-        parse_mode='Markdown',
-        reply_markup=reply_markup
+    results = list(results)
+    fixed = 0
+    for i in failed:
+        candidate = " ".join(retried[i])
+        if not part_needs_retry(parts[i], candidate):
+            results[i] = candidate
+            fixed += 1
+
+    metrics.inc("simplify_retry_parts", len(failed))
+    metrics.inc("simplify_retry_tokens", sum(sizes[i] for i in failed))
+    metrics.inc("simplify_retry_fixed", fixed)
+    metrics.inc("simplify_retry_failed", len(failed) - fixed)
+    metrics.observe("simplify_retry", time.monotonic() - start)
+    return results
+
+def reuse_previous_chunks(text, previous, analysis=None):
+    """Части прежней версии текста, все предложения которых остались без изменений.
+
+    Предложения сравниваются через difflib; возвращает [(start, end, tokens, result)]
+    с границами уже в новом тексте, по порядку.
+    """
+    old_text = previous["text"]
+    old_spans = previous.get("spans") or sentence_spans(old_text)
+    new_spans = analysis["spans"] if analysis is not None else sentence_spans(text)
+    matcher = SequenceMatcher(
+        None, [old_text[s:e] for s, e in old_spans], [text[s:e] for s, e in new_spans], autojunk=False
     )
+    mapping = {}
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            mapping[block.a + k] = block.b + k
+
+    old_starts = [s for s, _ in old_spans]
+    reused = []
+    last_end = 0
+    for (start, end, tokens), result in zip(previous["chunks"], previous["results"]):
+        first = bisect_right(old_starts, start) - 1
+        last = bisect_right(old_starts, end - 1) - 1
+        if first < 0 or end > old_spans[last][1]:
+            continue
+        sentences = range(first, last + 1)
+        if any(i not in mapping for i in sentences):
+            continue
+        # Предложения части должны и в новом тексте идти подряд
+        if [mapping[i] for i in sentences] != list(range(mapping[first], mapping[last] + 1)):
+            continue
+        # Внутри неизменённого предложения смещение постоянное
+        new_start = start + new_spans[mapping[first]][0] - old_spans[first][0]
+        new_end = end + new_spans[mapping[last]][0] - old_spans[last][0]
+        if new_start < last_end:
+            continue
+        reused.append((new_start, new_end, tokens, result))
+        last_end = new_end
+    return reused
+
+def simplify_document(text, strength="medium", previous=None, progress_callback=None, analysis=None, **kwargs):
+    """Упрощает длинный текст по частям и возвращает состояние для следующей правки:
+    {"text", "strength", "spans", "chunks": [(start, end, tokens)], "results", "result"}.
+
+    previous — состояние прежней версии текста: части без изменённых предложений
+    берутся из него, заново упрощаются только участки с правками.
+    analysis — разбор текста при получении (предложения и их токены).
+    """
+    simplify_tokenizer = kwargs.get("simplify_tokenizer")
+    reused = []
+    if previous and previous.get("strength") == strength:
+        reused = reuse_previous_chunks(text, previous, analysis)
+
+    # Промежутки между повторно используемыми частями планируются заново
+    chunks = []
+    pos = 0
+    for start, end, tokens, result in reused + [(len(text), len(text), 0, None)]:
+        if text[pos:start].strip():
+            chunks.extend(
+                (pos + s, pos + e, n, None)
+                for s, e, n in plan_simplify_chunks(
+                    text[pos:start], strength, simplify_tokenizer, analysis=sub_analysis(analysis, pos, start)
+                )
+            )
+        if end > start:
+            chunks.append((start, end, tokens, result))
+        pos = end
+
+    pending = [i for i, chunk in enumerate(chunks) if chunk[3] is None]
+    if reused:
+        print(f"♻️ Текст изменён: {len(reused)} частей без изменений, заново упрощаем {len(pending)}")
+        metrics.inc("simplify_chunks_reused", len(reused))
+    metrics.inc("simplify_chunks_generated", len(pending))
+
+    parts = [text[chunks[i][0]:chunks[i][1]] for i in pending]
+    sizes = [chunks[i][2] for i in pending]
+    results = [chunk[3] for chunk in chunks]
+    def on_parts(done, total, partial):
+        # Прогресс по всему тексту: готовые части прежней версии тоже показываются
+        merged = list(results)
+        for i, result in zip(pending, partial):
+            merged[i] = result
+        progress_callback(done + len(chunks) - total, len(chunks), merged)
+
+    if parts:
+        simplified = simplify_parts(
+            parts, strength=strength, progress_callback=on_parts if progress_callback else None, **kwargs
+        )
+        # Схлопнувшиеся и неизменённые части повторяются по отдельности, а не весь текст
+        simplified = retry_failed_parts(parts, simplified, sizes, strength=strength, **kwargs)
+        for i, result in zip(pending, simplified):
+            results[i] = result
+
+    return {
+        "text": text,
+        "strength": strength,
+        "spans": analysis["spans"] if analysis is not None else None,
+        "chunks": [(start, end, tokens) for start, end, tokens, _ in chunks],
+        "results": results,
+        "result": " ".join(results)
+    }
+
+def simplify_long_text(text, strength="medium", progress_callback=None, stream_callback=None, analysis=None,
+                       **kwargs):
+    simplify_tokenizer = kwargs.get("simplify_tokenizer")
+    if simplify_tokenizer is None:
+        return simplify_text(text, strength=strength, stream_callback=stream_callback, **kwargs)
+
+    # Части планируются по токенам: каждая целиком помещается во вход и в бюджет выхода
+    chunks = plan_simplify_chunks(text, strength, simplify_tokenizer, analysis=analysis)
 
-async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    help_text = (
-        "❓ *Помощь по TextEaseBot*\n\n"
-        "🤖 *Что я умею:*\n"
-        "• 📝 Упрощать сложные тексты на 2 уровнях\n"
-        "• 🌍 Переводить тексты на английский язык\n"
-        "• 📄 Работать с файлами .txt и .docx\n\n"
-        "📋 *Как начать:*\n"
-        "1. Отправьте мне текст напрямую\n"
-        "2. Или загрузите файл с текстом\n"
-        "3. Выберите нужную функцию из меню\n\n"
-        "🔧 *Уровни упрощения:*\n"
-        "• ⚖️ *Средний* - оптимальное упрощение\n"
-        "• 🔥 *Сильный* - максимальное упрощение\n\n"
-        "⚠️ *Ограничения:*\n"
-        "• Максимальный размер файла: 20 МБ\n"
-        "• Максимальная длина текста: 10 000 символов\n"
-        "• Я - ИИ, могу ошибаться в сложных темах\n\n"
-        "💡 *Совет:* Для длинных текстов используйте файлы."
+    # Если текст помещается в одну часть, обрабатываем целиком
+    if len(chunks) <= 1:
+        return simplify_text(text, strength=strength, stream_callback=stream_callback, **kwargs)
+
+    sizes = [tokens for _, _, tokens in chunks]
+    print(f"🔄 Обработка текста разбита на {len(chunks)} частей по {min(sizes)}–{max(sizes)} токенов")
+    return simplify_document(
+        text, strength=strength, progress_callback=progress_callback, analysis=analysis, **kwargs
+    )["result"]
+
+def split_translation_sentences(text, lang='ru'):
+    """Предложения для перевода; короткий текст остаётся одним куском"""
+    # Короткие тексты переводим целиком
+    if len(text) < TRANSLATE_SHORT_TEXT:
+        return [text]
+
+    return split_sentences(text, lang)
+
+def group_translation_chunks(sentences):
+    """Собирает подряд идущие предложения в чанки не более 400 символов"""
+    chunks = []
+    current_chunk = ""
+
+    for sent in sentences:
+        if len(current_chunk) + len(sent) + 1 < TRANSLATE_CHUNK_CHARS:
+            current_chunk += f" {sent}" if current_chunk else sent
+        else:
+            if current_chunk:
+                chunks.append(current_chunk)
+            current_chunk = sent
+
+    # Не забываем последний чанк
+    if current_chunk:
+        chunks.append(current_chunk)
+
+    return chunks
+
+def plan_translation_chunks(text, lang='ru'):
+    """Разбивает текст на смысловые чанки для перевода (не более 400 символов)"""
+    return group_translation_chunks(split_translation_sentences(text, lang))
+
+def translate_batch(chunks, translator_tokenizer=None, translator_model=None, device=None,
+                    batch_size=TRANSLATE_BATCH_SIZE, cancel_token=None, profile=PROFILE_QUALITY):
+    """Переводит чанки пакетами похожей длины, порядок сохраняется"""
+    results = [None] * len(chunks)
+    buckets = plan_length_buckets([len(chunk) for chunk in chunks], batch_size=batch_size, max_ratio=float('inf'))
+
+    for bucket in buckets:
+        inputs = translator_tokenizer(
+            [chunks[i] for i in bucket],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=512
+        ).to(device)
+
+        generation_params = {
+            "max_length": 600,
+            "num_beams": 5,
+            "early_stopping": True,
+            "no_repeat_ngram_size": 2,
+            "length_penalty": 1.0
+        }
+        generation_params.update(get_profile_params("translate", profile))
+        if generation_params["num_beams"] == 1:
+            generation_params.pop("early_stopping")
+        add_cancel_criteria(generation_params, cancel_token)
+
+        with torch.no_grad():
+            translated = translator_model.generate(
+                **inputs,
+                **generation_params
+            )
+
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
+        decoded = translator_tokenizer.batch_decode(translated, skip_special_tokens=True)
+        for i, result in zip(bucket, decoded):
+            results[i] = result
+
+    return results
+
+def postedit_translation(translated_parts, whole_text=True, bert_tokenizer=None, bert_model=None, device=None):
+    """Пост-обработка переведённых частей по правилам и их объединение.
+
+    BERT нужен только правилам с эмбеддингами; они применяются ко всему тексту один раз.
+    """
+    engine = get_postedit_engine()
+    result = " ".join(engine.apply(part) for part in translated_parts)
+
+    if whole_text and engine.needs_embeddings and bert_model and bert_tokenizer:
+        result = engine.apply_embedding_rules(result, make_bert_embedder(bert_tokenizer, bert_model, device))
+
+    return result
+
+def translate_text(text, translator_tokenizer=None, translator_model=None, bert_tokenizer=None, bert_model=None, device=None,
+                   cancel_token=None, profile=PROFILE_QUALITY, lang=None):
+    if not text.strip():
+        return ""
+
+    # Язык обычно уже известен из разбора текста при получении
+    chunks = plan_translation_chunks(text, lang or detect_language(text))
+    translated_parts = translate_batch(
+        chunks,
+        translator_tokenizer=translator_tokenizer,
+        translator_model=translator_model,
+        device=device,
+        cancel_token=cancel_token,
+        profile=profile
     )
-    keyboard = [
-        [
-            InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main"),
-            InlineKeyboardButton("🔄 Начать заново", callback_data="restart")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(
-        help_text,
-        parse_mode='Markdown',
-        reply_markup=reply_markup
+
+    return postedit_translation(
+        translated_parts,
+        whole_text=len(text) >= TRANSLATE_SHORT_TEXT,
+        bert_tokenizer=bert_tokenizer,
+        bert_model=bert_model,
+        device=device
     )
 
-async def handle_back_to_simplified(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    simplified = context.user_data.get('simplified_text', '').strip()
-    strength = context.user_data.get('last_strength', 'medium')
-    
-    if not simplified:
-        await safe_edit_message(query, "❌ Нет упрощённого текста.")
-        return
-    
-    strength_names = {
-        'light': 'лёгкий',
-        'medium': 'средний',
-        'strong': 'сильный'
+def evaluate_simplification(orig, simp):
+    orig_words = set(orig.lower().split())
+    simp_words = set(simp.lower().split())
+
+    keyword_overlap = len(orig_words & simp_words) / len(orig_words) * 100 if orig_words else 0
+    compression = round(len(simp.split()) / len(orig.split()) * 100, 1) if orig.split() else 0
+
+    orig_complexity = sum(len(word) for word in orig.split()) / len(orig.split()) if orig.split() else 0
+    simp_complexity = sum(len(word) for word in simp.split()) / len(simp.split()) if simp.split() else 0
+
+    return {
+        "original_length": len(orig.split()),
+        "simplified_length": len(simp.split()),
+        "compression_%": compression,
+        "keyword_overlap_%": round(keyword_overlap, 1),
+        "complexity_reduction": round(orig_complexity - simp_complexity, 2),
+        "quality_hint":
+            "🟢 Отличное упрощение" if keyword_overlap > 70 and compression < 80 else
+            "🟡 Хороший результат" if keyword_overlap > 50 else
+            "🔴 Плохое сохранение смысла"
     }
-    strength_name = strength_names.get(strength, 'средний')
-    
-    await safe_edit_message(
-        query,
-        f"✅ *Упрощённый текст ({strength_name}):*\n\n{simplified}",
-        reply_markup=get_simplify_keyboard(),
-        parse_mode='Markdown'
-    )
 
-async def handle_simplify(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    data = query.data
-    strength = data.split("_")[1]
-    text = context.user_data.get('pending_text', '').strip()
-    
-    if not text:
-        await safe_edit_message(query, "❌ Не найден текст для упрощения.")
-        return
-    
-    await safe_edit_message(query, f"🔄 Упрощаю текст ({strength} уровень)...")
-    
-    if len(text) > 2000:
-        parts = split_text(text, 1500)
-        total_parts = len(parts)
-        for i, part in enumerate(parts):
-            if part.strip():
-                progress = (i + 1) / total_parts * 100
-                await safe_edit_message(
-                    query,
-                    f"🔄 Упрощаю текст ({strength} уровень)...\n\n"
-                    f"Прогресс: {i+1}/{total_parts} частей ({progress:.0f}%)"
-                )
-                await asyncio.sleep(0.5)
-    
-    thinking_messages = [
-        "🧠 Анализирую структуру текста...",
-        "✍️ Упрощаю с сохранением смысла...",
-        "🔍 Переписываю — чтобы было ясно...",
-        "🧩 Готовлю результат...",
-        "✅ Почти готово!"
-    ]
-    random.shuffle(thinking_messages)
-    await send_thinking_messages(query, thinking_messages)
-    
+# --- Вспомогательные функции ---
+async def send_typing_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await outbound.chat_action(context.bot, update.effective_chat.id, "typing")
+
+async def safe_delete_file(file_path: str):
     try:
-        simplified = simplify_long_text(
-            text,
-            strength=strength,
-            simplify_tokenizer=context.bot_data['simplify_tokenizer'],
-            simplify_model=context.bot_data['simplify_model'],
-            device=context.bot_data['device']
-        )
-        
-        context.user_data['simplified_text'] = simplified
-        context.user_data['last_strength'] = strength
-        
-        metrics = evaluate_simplification(text, simplified)
-        quality_info = (
-            f"\n\n📊 *Оценка упрощения:*\n"
-            f"🔤 Длина: {metrics['original_length']} → {metrics['simplified_length']} слов\n"
-            f"⚖️ Сохранение смысла: {metrics['keyword_overlap_%']}%\n"
-            f"💡 {metrics['quality_hint']}"
-        )
-        
-        warning = ""
-        if len(simplified.split()) > 300:
-            warning = "\n\n⚠️ *Внимание:* текст длинный — мог быть частично обрезан."
-        
-        # Обновленная клавиатура без кнопки "Фактчекинг"
-        keyboard = [
-            [InlineKeyboardButton("🔤 Перевести на английский", callback_data="translate")],
-            [InlineKeyboardButton("🔄 Попробовать другой уровень", callback_data="change_level")],
-            [InlineKeyboardButton("📄 Показать оригинал", callback_data="show_original")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await safe_edit_message(
-            query,
-            f"✅ *Упрощённый текст ({strength}):*\n\n{simplified}{quality_info}{warning}",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        if os.path.exists(file_path):
+            os.remove(file_path)
     except Exception as e:
-        logger.error(f"Simplification error: {e}")
-        await safe_edit_message(query, f"❌ Ошибка при упрощении текста: {e}")
-
-async def handle_translate(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    simplified = context.user_data.get('simplified_text', '').strip()
-    
-    if not simplified:
-        await safe_edit_message(query, "❌ Нет текста для перевода.")
-        return
-    
-    await safe_edit_message(query, "🔤 Перевожу на английский...")
-    
+        print(f"Ошибка удаления файла {file_path}: {e}")
+
+async def read_txt_file(file_path: str) -> Optional[str]:
     try:
-        translated = translate_text(
-            simplified,
-            translator_tokenizer=context.bot_data['translator_tokenizer'],
-            translator_model=context.bot_data['translator_model'],
-            bert_tokenizer=context.bot_data['bert_tokenizer'],
-            bert_model=context.bot_data['bert_model'],
-            device=context.bot_data['device']
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Назад к упрощённому", callback_data="back_to_simplified")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await safe_edit_message(
-            query,
-            f"🇬🇧 *Перевод на английский:*\n\n{translated}",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        with open(file_path, 'rb') as f:
+            raw_data = f.read()
+
+        result = chardet.detect(raw_data)
+        encoding = result['encoding'] or 'utf-8'
+
+        return raw_data.decode(encoding, errors='replace')
     except Exception as e:
-        logger.error(f"Translation error: {e}")
-        await safe_edit_message(query, f"❌ Ошибка перевода: {e}")
-
-async def handle_change_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    # Проверяем, есть ли текст для упрощения
-    if not context.user_data.get('pending_text'):
-        await safe_edit_message(query, "❌ Нет текста для упрощения. Отправьте текст или файл сначала.")
-        return
-    
-    await query.message.reply_text(
-        "🔄 *Новый уровень упрощения*\nВыбери другой вариант:",
-        parse_mode='Markdown',
-        reply_markup=InlineKeyboardMarkup([
-            # Убрана кнопка "Лёгкий"
-            [InlineKeyboardButton("⚖️ Средний", callback_data="simplify_medium")],
-            [InlineKeyboardButton("🔥 Сильный", callback_data="simplify_strong")],
-            [InlineKeyboardButton("🔍 Фактчекинг", callback_data="fact_checking")]
-        ])
-    )
+        print(f"Ошибка чтения txt файла: {e}")
+        return None
 
-async def handle_show_original(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    original = context.user_data.get('pending_text', '').strip()
-    
-    if not original:
-        await query.answer("❌ Оригинальный текст не найден", show_alert=True)
-        return
-    
+async def read_docx_file(file_path: str) -> Optional[str]:
     try:
-        await query.delete_message()
+        doc = Document(file_path)
+        return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
     except Exception as e:
-        logger.warning(f"Error deleting message: {e}")
-    
-    max_length = 4096 - 100
-    if len(original) <= max_length:
-        await query.message.reply_text(
-            f"📜 *Оригинальный текст:*\n\n{original}",
-            parse_mode='Markdown'
-        )
-    else:
-        parts = split_text(original, max_chars=3500)
-        for i, part in enumerate(parts):
-            if part.strip():
-                text = f"📜 *Оригинальный текст (часть {i+1}):*\n\n{part}"
-                await query.message.reply_text(text, parse_mode='Markdown')
-                await asyncio.sleep(0.5)
-    
-    keyboard = [[InlineKeyboardButton("⬅️ Назад к упрощённому", callback_data="back_to_simplified")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.message.reply_text(
-        "Хочешь вернуться к упрощённому тексту?",
-        reply_markup=reply_markup
-    )
+        print(f"Ошибка чтения docx файла: {e}")
+        return None
 
-async def button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    data = query.data
-    user_id = update.effective_user.id
-    logger.info(f"User {user_id} clicked: {data}")
-    
-    if data.startswith("simplify_claim_"):
-        await simplify_claim(update, context)
-    elif data.startswith("change_claim_level_"):
-        await change_claim_level(update, context)
-    elif data.startswith("simplify_claim_medium_") or data.startswith("simplify_claim_strong_"):
-        # Извлекаем индекс утверждения и уровень
-        parts = data.split('_')
-        strength = parts[2]
-        claim_index = int(parts[3])
-        await simplify_claim_with_strength(update, context, claim_index, strength)
-    elif data == "back_to_uploaded_text":
-        await show_last_uploaded_text(update, context)
-    elif data == "back_to_fact_check":
-        from handlers import fact_checking_mode
-        await fact_checking_mode(update, context)
-    elif data == "fact_check_help":
-        await fact_check_help(update, context)
-    elif data == "fact_checking":
-        from handlers import fact_checking_mode
-        await fact_checking_mode(update, context)
-    elif data == "back_to_simplified":
-        await handle_back_to_simplified(update, context)
-    elif data.startswith("simplify_"):
-        await handle_simplify(update, context)
-    elif data == "translate":
-        await handle_translate(update, context)
-    elif data == "change_level":
-        await handle_change_level(update, context)
-    elif data == "show_original":
-        await handle_show_original(update, context)
-    elif data == "back_to_main":
-        keyboard = get_main_keyboard()
-        await query.message.reply_text(
-            "Выбери действие:",
-            reply_markup=keyboard
-        )
-    elif data == "help":
-        await show_help(update, context)
-    elif data == "restart":
-        from handlers import start
-        await start(update, context)
-    else:
-        logger.warning(f"Unknown callback data: {data}")
-        await query.edit_message_text("❌ Неизвестное действие")
-
-def setup_callbacks(application, models):
-    # Сохраняем модели в bot_data для доступа из обработчиков
-    application.bot_data.update(models)
-    
-    # Добавляем обработчик кнопок
-    application.add_handler(CallbackQueryHandler(button_click))
\ No newline at end of file
+def build_text_document(text: str, name: str, title: str = "", fmt: str = LONG_OUTPUT_FORMAT) -> Tuple[bytes, str]:
+    """Файл .txt или .docx с текстом в памяти: (содержимое, имя файла)"""
+    if fmt == "docx":
+        doc = Document()
+        if title:
+            doc.add_heading(title, level=1)
+        for paragraph in text.split("\n"):
+            if paragraph.strip():
+                doc.add_paragraph(paragraph)
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        return buffer.getvalue(), f"{name}.docx"
+    body = f"{title}\n\n{text}" if title else text
+    return body.encode("utf-8"), f"{name}.txt"
+
+async def send_text_document(message, text: str, name: str, title: str = ""):
+    """Отправляет длинный текст одним документом вместо серии сообщений"""
+    data, filename = await asyncio.to_thread(build_text_document, text, name, title)
+    metrics.inc("documents_sent")
+    # Байты, а не поток: при повторе после RetryAfter файл отправится целиком
+    return await outbound.document(message, data, filename, caption=title or None)
+
+async def safe_edit_message(query, text: str, reply_markup=None, parse_mode=None):
+    # RetryAfter и «message is not modified» обрабатывает планировщик; новое сообщение
+    # отправляем, только если отредактировать старое действительно нельзя
+    try:
+        await outbound.edit(query, text, reply_markup=reply_markup, parse_mode=parse_mode)
+    except RetryAfter as e:
+        logger.error(f"Error editing message: flood control не снят ({e})")
+    except Exception as e:
+        logger.error(f"Error editing message: {e}")
+        try:
+            await outbound.reply(query.message, text, reply_markup=reply_markup, parse_mode=parse_mode)
+        except Exception as fallback_error:
+            logger.error(f"Fallback error: {fallback_error}")
+
+def get_simplify_keyboard() -> InlineKeyboardMarkup:
+    # Обновленная клавиатура без кнопки "Фактчекинг"
+    keyboard = [
+        [InlineKeyboardButton("🔤 Перевести на английский", callback_data="translate")],
+        [InlineKeyboardButton("🔄 Попробовать другой уровень", callback_data="change_level")],
+        [InlineKeyboardButton("📄 Показать оригинал", callback_data="show_original")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_main_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру главного меню"""
+    keyboard = [
+        [
+            InlineKeyboardButton("⚖️ Среднее упрощение", callback_data="simplify_medium"),
+            InlineKeyboardButton("🔥 Сильное упрощение", callback_data="simplify_strong")
+        ],
+        [
+            InlineKeyboardButton("🌍 Перевод", callback_data="translate"),
+            InlineKeyboardButton("🔍 Фактчекинг", callback_data="fact_checking")
+        ],
+        [
+            InlineKeyboardButton("ℹ️ Помощь", callback_data="help")
+        ]
+    ]
+    return InlineKeyboardMarkup(keyboard)